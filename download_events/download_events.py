@@ -1,9 +1,25 @@
 import eventregistry as ER
 import json
 import argparse
-import pdb
+import copy
+import datetime
+import glob
+import re
 import sys
 import os
+import random
+import threading
+import time
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # only needed for the columnar (parquet) output
+    pa = None
 
 # map from query type name to object
 QUERY_TYPE = {
@@ -16,30 +32,23 @@ QUERY_TYPE = {
 }
 
 
-def connect_to_er(api_key, max_retries=3):
-    """Establish a connection to Event Registry."""
+def connect_to_er(api_key, max_retries=3, host=None):
+    """Establish a connection to Event Registry (or a stand-in server at host)."""
     if api_key is not None:
         er = ER.EventRegistry(
             apiKey = api_key,
+            host = host,
             repeatFailedRequestCount = max_retries)
     else:
         er = ER.EventRegistry(
+            host = host,
             repeatFailedRequestCount = max_retries)
 
     return er
 
 
-def download_event_list(er, query):
-    """Query Event Registry for event URI list."""
-    query.setRequestedResult(ER.RequestEventsUriList(count=300000))
-
-    return er.execQuery(query)
-
-
-def read_query(file):
-    """Read query from file."""
-    query_json = json.load(file)
-
+def parse_query(query_json):
+    """Build query from its saved (json) form."""
     query_type = query_json['type']
     query_str = json.dumps(query_json['query'])
     query = QUERY_TYPE[query_type].initWithComplexQuery(query_str)
@@ -47,29 +56,516 @@ def read_query(file):
     return query
 
 
-def get_events_list(query_fnm, out_fnm, api_key):
-    """Get list of event URIs from saved query."""
-    er = connect_to_er(api_key)
+def read_query(file):
+    """Read query from file."""
+    return parse_query(json.load(file))
+
+
+def event_info_query(batch):
+    """Query for the info of a batch of event URIs."""
+    query = ER.QueryEvent(batch)
+    query.setRequestedResult(
+        ER.RequestEventInfo(returnInfo = ER.ReturnInfo(
+            eventInfo = ER.EventInfoFlags(
+                title=True,
+                summary = True,
+                articleCounts = True,
+                concepts = True,
+                categories = True,
+                location = True,
+                date = True,
+                commonDates = False,
+                stories = False,
+                socialScore = True,
+                imageCount = 0))))
+    return query
+
 
+class Backoff(object):
+    """
+    Exponential backoff shared by the download threads: after a failed (e.g. rate limited)
+    request no thread sends a request until the delay has passed. The delay doubles with
+    each failure up to max_delay and is reset by a successful request.
+    """
+
+    def __init__(self, initial_delay=1.0, max_delay=60.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.resume_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Sleep until requests are allowed again."""
+        while True:
+            with self.lock:
+                remaining = self.resume_time - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def failure(self, retry_after=None):
+        """Back off after a failed request, for at least retry_after seconds if given."""
+        with self.lock:
+            self.delay = min(self.max_delay, max(self.initial_delay, 2 * self.delay))
+            # jitter, so the threads do not retry all at once
+            delay = self.delay * random.uniform(0.5, 1.0)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            self.resume_time = max(self.resume_time, time.time() + delay)
+
+    def success(self):
+        """Reset the delay after a successful request."""
+        with self.lock:
+            self.delay = 0.0
+
+
+def retry_after(er):
+    """Seconds to wait requested by the Retry-After header of the last response, if known."""
+    try:
+        return float(er.getLastHeader("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        # older clients do not keep the headers of the last response
+        return None
+
+
+def execute_query(er, query, backoff, max_retries=5):
+    """Execute query, backing off and retrying failed requests."""
+    for attempt in range(max_retries + 1):
+        backoff.wait()
+        try:
+            res = er.execQuery(query)
+        except Exception as e:
+            error = str(e)
+        else:
+            # older clients return None when the request failed
+            if res is not None and "error" not in res:
+                backoff.success()
+                return res
+            error = "no response" if res is None else res["error"]
+        backoff.failure(retry_after(er))
+
+    raise Exception("Event Registry error: %s" % error)
+
+
+def download_events_batch(er, batch, backoff, max_retries=5):
+    """Get info for a batch of event URIs, backing off and retrying failed requests."""
+    return execute_query(er, event_info_query(batch), backoff, max_retries=max_retries)
+
+
+class ThreadConnections(object):
+    """
+    A connection to Event Registry for each thread: the connection of an
+    EventRegistry object sends one request at a time.
+    """
+
+    def __init__(self, api_key, host=None):
+        self.api_key = api_key
+        self.host = host
+        self.local = threading.local()
+
+    def get(self):
+        if not hasattr(self.local, "er"):
+            # retries are handled by execute_query
+            self.local.er = connect_to_er(self.api_key, max_retries=1, host=self.host)
+        return self.local.er
+
+
+def imap_ordered(pool, function, items, n_in_flight):
+    """
+    Apply function to the items in a thread pool, with at most n_in_flight items
+    in flight. Yields (item, result) pairs in the order of the items.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, pool.apply_async(function, (item,))))
+        if len(pending) >= n_in_flight:
+            item, result = pending.popleft()
+            yield item, result.get()
+    while len(pending) > 0:
+        item, result = pending.popleft()
+        yield item, result.get()
+
+
+def date_slices(date_start, date_end, slice_days):
+    """Split the days from date_start to date_end (inclusive, YYYY-MM-DD) into ranges of slice_days days."""
+    start = datetime.datetime.strptime(date_start, "%Y-%m-%d").date()
+    end = datetime.datetime.strptime(date_end, "%Y-%m-%d").date()
+    slices = []
+    while start <= end:
+        slice_end = min(end, start + datetime.timedelta(days=slice_days - 1))
+        slices.append((start.strftime("%Y-%m-%d"), slice_end.strftime("%Y-%m-%d")))
+        start = slice_end + datetime.timedelta(days=1)
+    return slices
+
+
+def download_event_list(er, query, backoff, page=1, count=100000, max_retries=5):
+    """Query Event Registry for a page of event URI list, sorted by date."""
+    query.setRequestedResult(ER.RequestEventsUriList(page=page, count=count, sortBy="date", sortByAsc=True))
+
+    return execute_query(er, query, backoff, max_retries=max_retries)
+
+
+def download_event_list_slice(er, query_json, date_range, backoff, page_size=100000, max_retries=5):
+    """
+    Get the URIs of the events of a saved query in date_range (or in the dates of
+    the query if None), page by page. Returns the URIs and the number of events
+    Event Registry reports for the range.
+    """
+    if date_range is not None:
+        query_json = copy.deepcopy(query_json)
+        query_json['query']['$query']['dateStart'], query_json['query']['$query']['dateEnd'] = date_range
+
+    uris = []
+    page = 1
+    while True:
+        res = download_event_list(er, parse_query(query_json), backoff,
+            page=page, count=page_size, max_retries=max_retries)
+        uris.extend(res["uriList"]["results"])
+        if page >= res["uriList"].get("pages", 1):
+            break
+        page += 1
+
+    return uris, res["uriList"]["count"]
+
+
+def get_events_list(query_fnm, out_fnm, api_key, host=None, slice_days=30, n_workers=1, max_retries=5):
+    """
+    Get list of event URIs from saved query. The date range of the query is split
+    into slices of slice_days days, whose URI lists are downloaded by up to
+    n_workers threads and streamed to the output in date order, leaving out events
+    listed in an earlier slice. The events listed for each slice are checked
+    against the number Event Registry reports for it.
+    """
     with open(query_fnm) as query_file:
         print "Reading query from:", query_fnm
-        query = read_query(query_file)
-
-    print "Executiong query..."
-    res = download_event_list(er, query)
-
-    if "error" in res:
-        raise Exception("Event Registry error: %s" % res['error'])
-
-    with open(out_fnm, 'w') as outfile:
-        print "Writing query result to:", query_fnm
-        json.dump(res, outfile)
-
-
-def get_events_info(events_fnm, out_fnm, api_key):
-    """Get info for list of event URIs."""
-    er = connect_to_er(api_key)
+        query_json = json.load(query_file)
 
+    conditions = query_json['query'].get('$query', {})
+    if slice_days > 0 and 'dateStart' in conditions and 'dateEnd' in conditions:
+        slices = date_slices(conditions['dateStart'], conditions['dateEnd'], slice_days)
+    else:
+        # a query without a date range is not split
+        slices = [None]
+
+    connections = ThreadConnections(api_key, host=host)
+    backoff = Backoff()
+
+    def download(date_range):
+        return download_event_list_slice(connections.get(), query_json, date_range, backoff, max_retries=max_retries)
+
+    print "Executiong query in %d slices..." % len(slices)
+    listed = set()
+    slice_counts = []
+    pool = ThreadPool(n_workers)
+    try:
+        # the output only appears once it is complete
+        with open(out_fnm + ".tmp", 'w') as outfile:
+            print "Writing query result to:", out_fnm
+            outfile.write('{"uriList": {"results": [')
+            for date_range, (uris, count) in imap_ordered(pool, download, slices, n_workers):
+                new_uris = [uri for uri in uris if uri not in listed]
+                for uri in new_uris:
+                    outfile.write((", " if len(listed) > 0 else "") + json.dumps(uri))
+                    listed.add(uri)
+
+                date_start, date_end = date_range or (conditions.get('dateStart'), conditions.get('dateEnd'))
+                slice_counts.append({"dateStart": date_start, "dateEnd": date_end,
+                    "count": count, "listed": len(uris), "new": len(new_uris)})
+                print "\rlisted events until %s: %d" % (date_end, len(listed)),
+                sys.stdout.flush()
+            outfile.write('], "count": %d}, "slices": %s}' % (len(listed), json.dumps(slice_counts)))
+    finally:
+        pool.terminate()
+    if os.path.isfile(out_fnm):
+        os.remove(out_fnm)
+    os.rename(out_fnm + ".tmp", out_fnm)
+
+    # check completeness
+    n_slice_events = sum(slice_count["listed"] for slice_count in slice_counts)
+    print "\nListed %d events (%d in slices, %d in more than one slice)" % \
+        (len(listed), n_slice_events, n_slice_events - len(listed))
+    for slice_count in slice_counts:
+        if slice_count["listed"] < slice_count["count"]:
+            print "WARNING: listed only %d of %d events from %s to %s" % (slice_count["listed"],
+                slice_count["count"], slice_count["dateStart"], slice_count["dateEnd"])
+
+
+def read_last_line(infile, end, block_size=4096):
+    """
+    Read the last complete (newline terminated) line before byte offset end of a
+    file opened in binary mode, reading backwards from end. Returns None if there
+    is no complete line.
+    """
+    start = end
+    while start > 0:
+        start = max(0, start - block_size)
+        infile.seek(start)
+        data = infile.read(end - start)
+        last_newline = data.rfind(b"\n")
+        if last_newline < 0:
+            continue
+        # the line starts after the previous newline (or at the start of the file)
+        line_start = data.rfind(b"\n", 0, last_newline)
+        if line_start >= 0 or start == 0:
+            return data[line_start + 1:last_newline]
+    return None
+
+
+class Checkpoint(object):
+    """
+    Sidecar file of a get_events_info output, recording the downloaded batches:
+    a header line with the number of events, then a line "<start> <end> <offset>"
+    for every batch of events start - end written, with the size of the output
+    after it. Batches are written in order, so resuming only needs the last
+    complete line, which is read from the end of the file in constant time.
+    """
+
+    def __init__(self, fnm):
+        self.fnm = fnm
+
+    def start(self, n_events):
+        """Start a new checkpoint."""
+        with open(self.fnm, "wb") as outfile:
+            outfile.write(json.dumps({"n_events": n_events}) + "\n")
+
+    def resume(self, n_events):
+        """Return the number of events written and the size of the output."""
+        with open(self.fnm, "rb") as infile:
+            header = json.loads(infile.readline())
+            if header["n_events"] != n_events:
+                raise Exception("checkpoint %s is for a list of %d events, not %d" %
+                    (self.fnm, header["n_events"], n_events))
+            infile.seek(0, os.SEEK_END)
+            # a partially written last line is ignored
+            last_line = read_last_line(infile, infile.tell())
+        if last_line is None or last_line.startswith(b"{"):
+            # no batch written yet
+            return 0, 0
+        start, end, offset = [int(value) for value in last_line.split()]
+        return end, offset
+
+    def append(self, start, end, offset):
+        """Record a batch written to the output."""
+        with open(self.fnm, "ab") as outfile:
+            outfile.write("%d %d %d\n" % (start, end, offset))
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+
+def scan_output(out_fnm):
+    """
+    Count the complete events in an output written without a checkpoint, returning
+    their number and the size of the file up to the end of the last one.
+    """
+    n_lines = 0
+    offset = 0
+    with open(out_fnm, "rb") as infile:
+        for line in infile:
+            if not line.endswith(b"\n"):
+                break
+            n_lines += 1
+            offset += len(line)
+    return n_lines, offset
+
+
+class JsonLinesOutput(object):
+    """Events written one JSON object per line."""
+
+    def __init__(self, out_fnm):
+        self.out_fnm = out_fnm
+        self.outfile = None
+
+    def exists(self):
+        return os.path.isfile(self.out_fnm)
+
+    def scan(self):
+        """Events written and size of an output without a checkpoint."""
+        return scan_output(self.out_fnm)
+
+    def open(self, offset, last_uri):
+        """Open for writing after offset bytes, the last written event being last_uri."""
+        if self.exists():
+            with open(self.out_fnm, "r+b") as outfile:
+                # check if last event in right location
+                if last_uri is not None:
+                    last_event = json.loads(read_last_line(outfile, offset))
+                    if last_uri != last_event['info']['uri']:
+                        raise Exception("last event in file %s not in correct location" % self.out_fnm)
+                # drop a partially written batch
+                outfile.truncate(offset)
+        self.outfile = open(self.out_fnm, "ab")
+
+    def write(self, events):
+        for event in events:
+            self.outfile.write(json.dumps(event) + '\n')
+
+    def commit(self):
+        """Make the written events durable and return the size of the output."""
+        self.outfile.flush()
+        os.fsync(self.outfile.fileno())
+        return self.outfile.tell()
+
+    def close(self):
+        offset = self.commit()
+        self.outfile.close()
+        return offset
+
+
+def event_schema():
+    """Columns of the events in the columnar (parquet) output."""
+    return pa.schema([
+        ("uri", pa.string()),
+        ("date", pa.date32()),
+        ("title", pa.string()),
+        ("summary", pa.string()),
+        ("article_count", pa.int64()),
+        ("social_score", pa.int64()),
+        ("location_label", pa.string()),
+        ("location_country", pa.string()),
+        ("location_lat", pa.float64()),
+        ("location_long", pa.float64()),
+        ("concept_uris", pa.list_(pa.string())),
+        ("concept_labels", pa.list_(pa.string())),
+        ("concept_types", pa.list_(pa.string())),
+        ("concept_scores", pa.list_(pa.int64())),
+        ("category_uris", pa.list_(pa.string())),
+        ("category_wgts", pa.list_(pa.int64()))])
+
+
+def text(value, lang="eng"):
+    """Text of a multilingual field (a dict from language to text), in lang if available."""
+    if isinstance(value, dict):
+        if lang in value:
+            return value[lang]
+        return next(iter(value.values()), None)
+    return value
+
+
+def event_row(event):
+    """Flatten the info of an event into the columns of event_schema."""
+    info = event.get("info") or {}
+    event_date = info.get("eventDate")
+    article_counts = info.get("articleCounts") or {}
+    location = info.get("location") or {}
+    concepts = info.get("concepts") or []
+    categories = info.get("categories") or []
+    return {
+        "uri": info.get("uri"),
+        "date": datetime.datetime.strptime(event_date, "%Y-%m-%d").date() if event_date else None,
+        "title": text(info.get("title")),
+        "summary": text(info.get("summary")),
+        "article_count": article_counts.get("total", sum(article_counts.values())),
+        "social_score": info.get("socialScore"),
+        "location_label": text(location.get("label")),
+        "location_country": text((location.get("country") or {}).get("label")),
+        "location_lat": location.get("lat"),
+        "location_long": location.get("long"),
+        "concept_uris": [concept.get("uri") for concept in concepts],
+        "concept_labels": [text(concept.get("label")) for concept in concepts],
+        "concept_types": [concept.get("type") for concept in concepts],
+        "concept_scores": [concept.get("score") for concept in concepts],
+        "category_uris": [category.get("uri") for category in categories],
+        "category_wgts": [category.get("wgt") for category in categories]}
+
+
+# format of the partition of an event date, e.g. month=2015-01
+PARTITION_FORMATS = {"year": "%Y", "month": "%Y-%m", "day": "%Y-%m-%d"}
+
+
+class ParquetOutput(object):
+    """
+    Events written to a directory of zstd compressed parquet files, partitioned by
+    event date (e.g. month=2015-01/part-00003.parquet). Events are buffered and
+    each flush writes a new part file to every partition with buffered events, so
+    written files are never modified and the number of flushes identifies the
+    output written so far.
+    """
+
+    def __init__(self, out_dir, partition="month", flush_rows=100000):
+        if pa is None:
+            raise Exception("parquet output needs pyarrow (pip install pyarrow)")
+        self.out_dir = out_dir
+        self.partition = partition
+        self.flush_rows = flush_rows
+        self.schema = event_schema()
+        self.buffers = {}
+        self.n_buffered = 0
+        self.n_parts = 0
+
+    def exists(self):
+        return os.path.isdir(self.out_dir)
+
+    def scan(self):
+        raise Exception("%s has no checkpoint to continue from" % self.out_dir)
+
+    def open(self, offset, last_uri):
+        """Open for writing after offset flushes."""
+        # remove the part files of an interrupted flush
+        for part_fnm in glob.glob(os.path.join(self.out_dir, "*", "part-*.parquet*")):
+            if int(re.search(r"part-(\d+)", os.path.basename(part_fnm)).group(1)) >= offset:
+                os.remove(part_fnm)
+        self.n_parts = offset
+
+    def write(self, events):
+        for event in events:
+            row = event_row(event)
+            partition = "unknown"
+            if row["date"] is not None:
+                partition = row["date"].strftime(PARTITION_FORMATS[self.partition])
+            self.buffers.setdefault(partition, []).append(row)
+        self.n_buffered += len(events)
+
+    def flush(self):
+        if self.n_buffered == 0:
+            return
+        for partition, rows in self.buffers.items():
+            partition_dir = os.path.join(self.out_dir, "%s=%s" % (self.partition, partition))
+            if not os.path.isdir(partition_dir):
+                os.makedirs(partition_dir)
+            table = pa.Table.from_arrays(
+                [pa.array([row[field.name] for row in rows], type=field.type) for field in self.schema],
+                schema=self.schema)
+            # a part file only appears once it is complete
+            part_fnm = os.path.join(partition_dir, "part-%05d.parquet" % self.n_parts)
+            pq.write_table(table, part_fnm + ".tmp", compression="zstd")
+            os.rename(part_fnm + ".tmp", part_fnm)
+        self.buffers = {}
+        self.n_buffered = 0
+        self.n_parts += 1
+
+    def commit(self):
+        """Flush if enough events are buffered, returning the number of flushes (None if not flushed)."""
+        if self.n_buffered < self.flush_rows:
+            return None
+        self.flush()
+        return self.n_parts
+
+    def close(self):
+        self.flush()
+        return self.n_parts
+
+
+def open_output(out_fnm, out_format="jsonl", partition="month"):
+    """Output of get_events_info in the given format."""
+    if out_format == "parquet":
+        return ParquetOutput(out_fnm, partition=partition)
+    return JsonLinesOutput(out_fnm)
+
+
+def get_events_info(events_fnm, out_fnm, api_key, host=None, step=200, n_workers=1, max_retries=5,
+                    out_format="jsonl", partition="month"):
+    """
+    Get info for list of event URIs. Up to n_workers batches of step events are
+    downloaded concurrently, each by a thread with its own connection, and the
+    events are written in the order of the list as their batches complete: as
+    JSON lines, or into a directory of parquet files partitioned by event date.
+
+    The progress is recorded in a checkpoint file next to the output (out_fnm +
+    ".checkpoint"), from which an interrupted download continues. Batches that
+    complete ahead of an earlier one wait for it, so the output and the checkpoint
+    only ever hold a complete prefix of the list.
+    """
     with open(events_fnm) as infile:
         event_uri_res = json.load(infile)
     n_events = event_uri_res["uriList"]["count"]
@@ -79,61 +575,87 @@ def get_events_info(events_fnm, out_fnm, api_key):
     print "Writing output into %s" % out_fnm
 
     loc = 0
-    step = 200
+    offset = 0
 
-    mode = "w"
-    if os.path.isfile(out_fnm):
+    output = open_output(out_fnm, out_format, partition)
+    checkpoint = Checkpoint(out_fnm + ".checkpoint")
+    if output.exists():
         print "file %s already exists - continuing from last downloaded event" % out_fnm
-        with open(out_fnm) as infile:
-            lines = infile.readlines()
-            if len(lines) > 0:
-                last_event = json.loads(lines[-1])
-                # check if last event in right location
-                try:
-                    assert event_uri_list[len(lines)-1] == last_event['info']['uri'], \
-                    "last event in file not in correct location"
-                except:
-                    pdb.set_trace()
-                loc = len(lines)
-            mode = "a"
-            print "starting at event %d" % loc
-
-    with open(out_fnm, mode) as outfile:
-        while loc < n_events:
-            end = min(n_events, loc + step)
-
-            print "\rdownloading info for events: %d - %d" % (loc, end),
-            sys.stdout.flush()
+        if os.path.isfile(checkpoint.fnm):
+            loc, offset = checkpoint.resume(n_events)
+        else:
+            # output of a download without a checkpoint - scan it once
+            loc, offset = output.scan()
+            checkpoint.start(n_events)
+            checkpoint.append(0, loc, offset)
+        print "starting at event %d" % loc
+    else:
+        checkpoint.start(n_events)
+    output.open(offset, event_uri_list[loc-1] if loc > 0 else None)
+    # end of the events recorded in the checkpoint
+    committed = loc
 
-            batch = event_uri_list[loc:end]
-            query = ER.QueryEvent(batch)
-            query.setRequestedResult(
-                ER.RequestEventInfo(returnInfo = ER.ReturnInfo(
-                    eventInfo = ER.EventInfoFlags(
-                        title=True,
-                        summary = True,
-                        articleCounts = True,
-                        concepts = True,
-                        categories = True,
-                        location = True,
-                        date = True,
-                        commonDates = False,
-                        stories = False,
-                        socialScore = True,
-                        imageCount = 0))))
-
-            batch_res = er.execQuery(query)
+    connections = ThreadConnections(api_key, host=host)
+    backoff = Backoff()
 
-            # dump events into files in the same order as they are in the batch
-            for event_uri in batch:
-                outfile.write(json.dumps(batch_res[event_uri]) + '\n')
+    def download(batch):
+        return download_events_batch(connections.get(), batch, backoff, max_retries=max_retries)
+
+    batches = (event_uri_list[batch_loc:batch_loc + step] for batch_loc in range(loc, n_events, step))
+    pool = ThreadPool(n_workers)
+    try:
+        batch_loc = loc
+        for batch, batch_res in imap_ordered(pool, download, batches, n_workers):
+            batch_end = batch_loc + len(batch)
 
-            loc = loc + 200
+            print "\rdownloading info for events: %d - %d" % (batch_loc, batch_end),
+            sys.stdout.flush()
+
+            # dump events into files in the same order as they are in the batch
+            output.write([batch_res[event_uri] for event_uri in batch])
+
+            # the events are on disk before they are recorded in the checkpoint
+            offset = output.commit()
+            if offset is not None:
+                checkpoint.append(committed, batch_end, offset)
+                committed = batch_end
+            batch_loc = batch_end
+
+        offset = output.close()
+        if committed < n_events:
+            checkpoint.append(committed, n_events, offset)
+    finally:
+        pool.terminate()
+
+
+def convert_events(jsonl_fnm, out_dir, partition="month", chunk_size=10000):
+    """Convert events info downloaded as JSON lines into parquet files partitioned by event date."""
+    if os.path.exists(out_dir):
+        raise Exception("%s already exists" % out_dir)
+
+    print "Converting %s into %s" % (jsonl_fnm, out_dir)
+    output = ParquetOutput(out_dir, partition=partition)
+    output.open(0, None)
+    n_events = 0
+    with open(jsonl_fnm, "rb") as infile:
+        events = []
+        for line in infile:
+            events.append(json.loads(line))
+            if len(events) == chunk_size:
+                output.write(events)
+                output.commit()
+                n_events += len(events)
+                events = []
+        output.write(events)
+        n_events += len(events)
+    output.close()
+    print "Converted %d events" % n_events
 
 
 if __name__ == '__main__':
     argparser = argparse.ArgumentParser()
     argparser.add_argument('--api_key', type=str, default=None, help='Event Registry API key.')
+    argparser.add_argument('--host', type=str, default=None, help='Event Registry host, e.g. http://localhost:8000 for a stand-in server.')
 
     subparsers = argparser.add_subparsers(help='commands')
 
@@ -141,16 +663,35 @@ if __name__ == '__main__':
     list_argparser.set_defaults(action='list')
     list_argparser.add_argument('query_fnm', type=str, help='Path to query file.')
     list_argparser.add_argument('out_fnm', type=str, help='Path to output file.')
+    list_argparser.add_argument('--slice_days', type=int, default=30, help='Number of days of the date range of the query listed at once (0 to list all at once).')
+    list_argparser.add_argument('--workers', type=int, default=1, help='Number of slices listed concurrently.')
+    list_argparser.add_argument('--max_retries', type=int, default=5, help='Number of retries of a failed or rate limited request.')
 
 
     info_argparser = subparsers.add_parser("info", help='Get events info.')
     info_argparser.set_defaults(action='info')
     info_argparser.add_argument('events_fnm', type=str, help='Path to file with events uri list.')
     info_argparser.add_argument('out_fnm', type=str, help='Path to output file.')
+    info_argparser.add_argument('--batch_size', type=int, default=200, help='Number of events per request.')
+    info_argparser.add_argument('--workers', type=int, default=1, help='Number of batches downloaded concurrently.')
+    info_argparser.add_argument('--max_retries', type=int, default=5, help='Number of retries of a failed or rate limited request.')
+    info_argparser.add_argument('--format', type=str, choices=['jsonl', 'parquet'], default='jsonl', help='Output format: JSON lines, or a directory of zstd compressed parquet files partitioned by event date.')
+    info_argparser.add_argument('--partition', type=str, choices=sorted(PARTITION_FORMATS), default='month', help='Event date partitions of the parquet output.')
+
+    convert_argparser = subparsers.add_parser("convert", help='Convert events info from JSON lines to parquet.')
+    convert_argparser.set_defaults(action='convert')
+    convert_argparser.add_argument('events_info_fnm', type=str, help='Path to file with events info (JSON lines).')
+    convert_argparser.add_argument('out_dir', type=str, help='Path to output directory.')
+    convert_argparser.add_argument('--partition', type=str, choices=sorted(PARTITION_FORMATS), default='month', help='Event date partitions of the parquet output.')
 
     args = argparser.parse_args()
 
     if args.action == 'list':
-        get_events_list(args.query_fnm, args.out_fnm, args.api_key)
+        get_events_list(args.query_fnm, args.out_fnm, args.api_key, host=args.host,
+            slice_days=args.slice_days, n_workers=args.workers, max_retries=args.max_retries)
     elif args.action == 'info':
-        get_events_info(args.events_fnm, args.out_fnm, args.api_key)
+        get_events_info(args.events_fnm, args.out_fnm, args.api_key, host=args.host,
+            step=args.batch_size, n_workers=args.workers, max_retries=args.max_retries,
+            out_format=args.format, partition=args.partition)
+    elif args.action == 'convert':
+        convert_events(args.events_info_fnm, args.out_dir, partition=args.partition)
@@ -0,0 +1,170 @@
+"""
+Local stand-in for the Event Registry HTTP API, for trying out download_events.py offline:
+
+    python stand_in_server.py --port 8000 --latency 0.5 --rate_limit 10
+    python download_events.py --host http://localhost:8000 list query_sports_2015_17.json events.json
+    python download_events.py --host http://localhost:8000 info events.json events_info.jsonl --workers 8
+
+It answers event URI list queries (with synthetic events on each day of the queried
+date range) and event info queries, and can simulate latency, rate limiting and
+failing requests.
+"""
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+def event_uris(date_start, date_end, events_per_day):
+    """Synthetic event URIs of the events on each day from date_start to date_end (inclusive)."""
+    day = datetime.datetime.strptime(date_start, "%Y-%m-%d").date()
+    last_day = datetime.datetime.strptime(date_end, "%Y-%m-%d").date()
+    uris = []
+    while day <= last_day:
+        uris.extend("eng-%s-%d" % (day.strftime("%Y%m%d"), i) for i in range(events_per_day))
+        day += datetime.timedelta(days=1)
+    return uris
+
+
+def event_info(uri):
+    """Synthetic info of an event."""
+    day = uri.split("-")[1]
+    rand = random.Random(uri)
+    return {"info": {
+        "uri": uri,
+        "title": {"eng": "Event %s" % uri},
+        "summary": {"eng": "Summary of event %s." % uri},
+        "eventDate": "%s-%s-%s" % (day[:4], day[4:6], day[6:]),
+        "articleCounts": {"eng": rand.randint(1, 50), "total": rand.randint(50, 100)},
+        "concepts": [
+            {"uri": "http://en.wikipedia.org/wiki/Concept_%d" % concept,
+             "label": {"eng": "Concept %d" % concept},
+             "type": rand.choice(["wiki", "person", "loc", "org"]),
+             "score": rand.randint(1, 100)}
+            for concept in rand.sample(range(1000), rand.randint(0, 10))],
+        "categories": [
+            {"uri": "dmoz/Sports/Category_%d" % category, "label": "dmoz/Sports/Category_%d" % category, "wgt": rand.randint(1, 100)}
+            for category in rand.sample(range(100), rand.randint(0, 3))],
+        "location": rand.choice([None, {
+            "type": "place",
+            "label": {"eng": "Ljubljana"},
+            "lat": 46.05,
+            "long": 14.51,
+            "country": {"type": "country", "label": {"eng": "Slovenia"}}}]),
+        "socialScore": rand.randint(0, 1000)}}
+
+
+class RateLimiter(object):
+    """Allow at most rate requests per second (a token bucket)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # set by main from the command line arguments
+    settings = None
+    rate_limiter = None
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        params = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("utf8"))
+        settings = self.settings
+
+        if self.rate_limiter is not None and not self.rate_limiter.allow():
+            self.send_json(429, {"error": "Too many requests"}, headers=[("Retry-After", "1")])
+            return
+        time.sleep(settings.latency * random.uniform(0.5, 1.5))
+        if random.random() < settings.failure_rate:
+            self.send_json(503, {"error": "Service unavailable"})
+            return
+
+        result_types = params.get("resultType", [])
+        if not isinstance(result_types, list):
+            result_types = [result_types]
+        if self.path != "/json/event":
+            self.send_json(404, {"error": "Unknown method %s" % self.path})
+        elif params.get("action") == "getEvent":
+            uris = params["eventUri"]
+            if not isinstance(uris, list):
+                uris = [uris]
+            self.send_json(200, dict((uri, event_info(uri)) for uri in uris))
+        elif params.get("action") == "getEvents" and "uriList" in result_types:
+            query = json.loads(params["query"])["$query"]
+            uris = event_uris(query["dateStart"], query["dateEnd"], settings.events_per_day)
+            count = params.get("uriListCount", 100000)
+            page = params.get("uriListPage", 1)
+            # like Event Registry, silently return at most max_uri_list results
+            self.send_json(200, {"uriList": {
+                "results": uris[(page - 1) * count:page * count][:settings.max_uri_list],
+                "count": len(uris),
+                "page": page,
+                "pages": (len(uris) + count - 1) // count}})
+        else:
+            self.send_json(200, {"error": "Unsupported query"})
+
+    def log_message(self, format, *args):
+        if not self.settings.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main(args):
+    StandInHandler.settings = args
+    if args.rate_limit is not None:
+        StandInHandler.rate_limiter = RateLimiter(args.rate_limit)
+    server = ThreadingHTTPServer(("localhost", args.port), StandInHandler)
+    print("Stand-in Event Registry listening on http://localhost:%d" % args.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Local stand-in for the Event Registry API.')
+    argparser.add_argument('--port', type=int, default=8000, help='Port to listen on.')
+    argparser.add_argument('--events_per_day', type=int, default=100, help='Number of synthetic events on each day.')
+    argparser.add_argument('--latency', type=float, default=0.0, help='Average response time in seconds.')
+    argparser.add_argument('--rate_limit', type=float, default=None, help='Maximum number of requests per second, more are answered with 429.')
+    argparser.add_argument('--failure_rate', type=float, default=0.0, help='Fraction of requests that fail with 503.')
+    argparser.add_argument('--max_uri_list', type=int, default=300000, help='Maximum number of event URIs in a response.')
+    argparser.add_argument('--quiet', action='store_true', help='Do not log requests.')
+
+    args = argparser.parse_args()
+
+    main(args)
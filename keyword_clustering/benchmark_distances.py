@@ -0,0 +1,69 @@
+# Developed in Python 3.6.7
+
+# Code for measuring the throughput of the blocked distance computation in cluster_keywords.py against a plain matrix product.
+
+import argparse
+import time
+
+import numpy as np
+
+import cluster_keywords as ck
+
+
+def random_embeddings(n_items, n_dimensions, dtype, random_state):
+    """
+    Generate random normalized embeddings.
+
+    Args:
+        n_items: Number of embeddings.
+        n_dimensions: Dimension of the embeddings.
+        dtype: Floating point type of the embeddings.
+        random_state: numpy RandomState object.
+
+    Returns:
+        A numpy array of dimensions n_items x n_dimensions.
+    """
+    embeddings = random_state.randn(n_items, n_dimensions).astype(dtype)
+    return embeddings / np.linalg.norm(embeddings, ord=2, axis=-1, keepdims=True)
+
+
+def main_benchmark(args):
+    random_state = np.random.RandomState(args.seed)
+    keywords = random_embeddings(args.n_keywords, args.n_dimensions, args.dtype, random_state)
+    categories = random_embeddings(args.n_categories, args.n_dimensions, args.dtype, random_state)
+    flops = 2. * args.n_keywords * args.n_categories * args.n_dimensions
+    print(f"{args.n_keywords} x {args.n_categories} distances of {args.n_dimensions}-dimensional {args.dtype} embeddings, "
+          f"{ck._blas_threads()} BLAS threads")
+    print("method\tmemory budget [MB]\tseconds\tGFLOP/s")
+
+    # the plain matrix product (in blocks of keywords, so it fits in memory) is the reference
+    start = time.time()
+    for keywords_start in range(0, args.n_keywords, 10000):
+        np.matmul(keywords[keywords_start:keywords_start + 10000], categories.T)
+    matmul_time = time.time() - start
+    print(f"matmul\t-\t{matmul_time:.3f}\t{flops / matmul_time / 1e9:.1f}")
+
+    # the categorizer only needs the type of the computation from the embedder
+    embedder = ck.SIFEmbedder(None, dtype=args.dtype)
+    for memory_budget in args.memory_budget:
+        start = time.time()
+        ck._compute_distances_raw(keywords, categories, embedder, n_closest=args.k, memory_budget=memory_budget * 2 ** 20)
+        distances_time = time.time() - start
+        print(f"blocked\t{memory_budget}\t{distances_time:.3f}\t{flops / distances_time / 1e9:.1f}")
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description='Benchmark of the blocked distance computation against a plain matrix product.')
+
+    argparser.add_argument('--n_keywords', type=int, default=100000, help='Number of keyword embeddings. (default: 100000)')
+    argparser.add_argument('--n_categories', type=int, default=5000, help='Number of category embeddings. (default: 5000)')
+    argparser.add_argument('--n_dimensions', type=int, default=300, help='Dimension of the embeddings. (default: 300)')
+    argparser.add_argument('--k', type=int, default=3, help='Number of closest categories to return. (default: 3)')
+    argparser.add_argument('--dtype', type=str, choices=['float32', 'float64'], default='float32', help='Floating point type of the computation. (default: float32)')
+    argparser.add_argument('--memory_budget', type=int, nargs='+', default=[16, 64, 256, 1024], help='Memory budgets in MB to benchmark. (default: 16 64 256 1024)')
+    argparser.add_argument('--seed', type=int, default=0, help='Random seed. (default: 0)')
+
+    args = argparser.parse_args()
+
+    main_benchmark(args)
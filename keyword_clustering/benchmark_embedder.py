@@ -0,0 +1,100 @@
+# Developed in Python 3.6.7
+
+# Code for comparing load time and memory of the json and binary (.npz) embedder parameter formats.
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import cluster_keywords as ck
+
+
+def synthetic_embedder(n_words, n_dimensions, random_state):
+    """
+    Create a fitted embedder with a synthetic vocabulary of Zipf-distributed word frequencies.
+
+    Args:
+        n_words: Size of the vocabulary.
+        n_dimensions: Dimension of the principal components.
+        random_state: numpy RandomState object.
+
+    Returns:
+        SIFEmbedder object (without a FastText model).
+    """
+    embedder = ck.SIFEmbedder(None)
+    frequencies = random_state.zipf(1.5, size=n_words).clip(max=10 ** 6)
+    embedder.word_frequencies = {f"word{word_i}": int(frequency) for word_i, frequency in enumerate(frequencies)}
+    embedder._update_word_weights()
+    embedder.principal_components = random_state.randn(1, n_dimensions)
+    embedder.version = 1
+    embedder.fitted = True
+    return embedder
+
+
+def peak_memory():
+    """
+    Peak resident memory of this process in MB (Linux only).
+    """
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.
+
+
+def _load(path, words, results):
+    # runs in a fresh process, so the peak memory only includes this load
+    memory_before = peak_memory()
+    start = time.time()
+    embedder = ck.SIFEmbedder(None)
+    embedder.load_file(path)
+    load_time = time.time() - start
+
+    # look up the weights of some words as embedding does
+    start = time.time()
+    if isinstance(embedder.word2weight, ck.WordTable):
+        embedder.word2weight.lookup(words, default=0.)
+    else:
+        [embedder.word2weight.get(word, 0.) for word in words]
+    lookup_time = time.time() - start
+
+    results.put((load_time, lookup_time, peak_memory() - memory_before))
+
+
+def main_benchmark(args):
+    random_state = np.random.RandomState(args.seed)
+    embedder = synthetic_embedder(args.n_words, args.n_dimensions, random_state)
+    words = [f"word{word_i}" for word_i in random_state.randint(args.n_words, size=args.n_lookups)]
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Vocabulary of {args.n_words} words, looking up {args.n_lookups} words")
+        print("format\tsize [MB]\tload [s]\tlookup [s]\tpeak memory [MB]")
+        for extension in ["json", "npz"]:
+            path = os.path.join(directory, f"embedder.{extension}")
+            embedder.save_file(path)
+
+            results = context.Queue()
+            process = context.Process(target=_load, args=(path, words, results))
+            process.start()
+            load_time, lookup_time, memory = results.get()
+            process.join()
+            size = os.path.getsize(path) / 1024. ** 2
+            print(f"{extension}\t{size:.1f}\t{load_time:.3f}\t{lookup_time:.3f}\t{memory:.1f}")
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description='Benchmark of loading the embedder parameters in json and binary format.')
+
+    argparser.add_argument('--n_words', type=int, default=1000000, help='Size of the vocabulary. (default: 1000000)')
+    argparser.add_argument('--n_dimensions', type=int, default=300, help='Dimension of the word vectors. (default: 300)')
+    argparser.add_argument('--n_lookups', type=int, default=10000, help='Number of word weights looked up after loading. (default: 10000)')
+    argparser.add_argument('--seed', type=int, default=0, help='Random seed. (default: 0)')
+
+    args = argparser.parse_args()
+
+    main_benchmark(args)
@@ -0,0 +1,293 @@
+# Developed in Python 3.6.7
+
+# Code for benchmarking the hot paths of cluster_keywords.py offline, with a synthetic model and generated keywords.
+# Results are stored as json, so runs on different commits can be compared with the compare command.
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import cluster_keywords as ck
+
+
+class SyntheticModel(object):
+    """
+    A stand-in for a FastText model: fixed random vectors for a vocabulary and, like the subword buckets of
+    FastText, vectors from a hashed bucket for any other word.
+    """
+    def __init__(self, words, dimension=300, n_buckets=10000, seed=0):
+        """
+        Initialize the model.
+
+        Args:
+            words: A list of words (str) of the vocabulary.
+            dimension: Dimension of the word vectors. (default: 300)
+            n_buckets: Number of vectors shared by out-of-vocabulary words. (default: 10000)
+            seed: Random seed of the vectors. (default: 0)
+        """
+        random_state = np.random.RandomState(seed)
+        self.words = list(words)
+        self.word2id = {word: i for i, word in enumerate(self.words)}
+        self.vectors = random_state.randn(len(self.words), dimension).astype(np.float32)
+        self.buckets = random_state.randn(n_buckets, dimension).astype(np.float32)
+
+    def get_dimension(self):
+        return self.vectors.shape[1]
+
+    def get_word_vector(self, word):
+        if word in self.word2id:
+            return self.vectors[self.word2id[word]]
+        return self.buckets[zlib.crc32(word.encode("utf8")) % len(self.buckets)]
+
+    def get_words(self):
+        return self.words
+
+
+def synthetic_keywords(n_keywords, n_words, seed):
+    """
+    Generate keywords of 1 to 5 words drawn from a vocabulary with Zipf-distributed word frequencies.
+
+    Args:
+        n_keywords: Number of keywords.
+        n_words: Size of the vocabulary.
+        seed: Random seed.
+
+    Returns:
+        A list of keywords (str).
+    """
+    random_state = np.random.RandomState(seed)
+    lengths = random_state.randint(1, 6, size=n_keywords)
+    word_ids = (random_state.zipf(1.3, size=lengths.sum()) - 1) % n_words
+    words = [f"word{word_id}" for word_id in word_ids.tolist()]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).tolist()
+    return [" ".join(words[offsets[i]:offsets[i + 1]]) for i in range(n_keywords)]
+
+
+def rss():
+    """
+    Current and peak resident memory of this process in MB (Linux only).
+    """
+    memory = {}
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                memory[line.split(":")[0]] = int(line.split()[1]) / 1024.
+    return memory["VmRSS"], memory["VmHWM"]
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory to the current one (Linux 4.0+), so it only covers what follows.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def batches(keywords, batch_size):
+    return [keywords[start:start + batch_size] for start in range(0, len(keywords), batch_size)]
+
+
+def setup_benchmark(name, n_keywords, args, path_embedder):
+    """
+    Prepare the data of a benchmark.
+
+    Returns:
+        Tuple of a list of calls to time and the number of items (keywords, or words for load) they process in total.
+    """
+    vocabulary = [f"word{word_i}" for word_i in range(args.n_words)]
+    model = SyntheticModel(vocabulary, dimension=args.n_dimensions, seed=args.seed)
+    if args.word_vectors:
+        model = ck.WordVectors.build(model, vocabulary)
+    keywords = synthetic_keywords(n_keywords, args.n_words, args.seed)
+
+    if name == "fit":
+        embedder = ck.SIFEmbedder(model)
+        return [lambda: embedder.fit(keywords)] * args.repeats, n_keywords * args.repeats
+    if name in ["load", "load_npz"]:
+        path = path_embedder + (".npz" if name == "load_npz" else ".json")
+        embedder = ck.SIFEmbedder(model)
+        embedder.load_file(path)
+        n_words = len(embedder.word_frequencies)
+        return [lambda: ck.SIFEmbedder(model).load_file(path)] * args.repeats, n_words * args.repeats
+
+    embedder = ck.SIFEmbedder(model)
+    embedder.load_file(path_embedder + ".npz")
+    categories = synthetic_keywords(args.n_categories, args.n_words, args.seed + 1)
+    categorizer = ck.Categorizer(embedder)
+    categorizer.fit(categories)
+
+    if name == "sif_embedding":
+        return [
+            lambda batch=batch: ck.sif_embedding(
+                batch, embedder.model, embedder.word_frequencies, principal_components=embedder.principal_components,
+                n_all_words=embedder.n_all_words, word2weight=embedder.word2weight, dtype=embedder.dtype)
+            for batch in batches(keywords, args.batch_size)
+        ], n_keywords
+    if name == "distances":
+        return [
+            lambda batch=batch: ck._compute_distances_raw(
+                batch, categorizer.category_embeddings, embedder, n_closest=args.k, return_distances=True)
+            for batch in batches(ck.TokenizedKeywords(keywords), args.batch_size)
+        ], n_keywords
+    if name == "categorize":
+        return [
+            lambda batch=batch: categorizer.categorize(batch, n_categories=args.k)
+            for batch in batches(keywords, args.batch_size)
+        ], n_keywords
+    if name == "closest_keywords":
+        return [lambda: categorizer.closest_keywords(keywords, n_keywords=args.n_closest_keywords)] * args.repeats, n_keywords * args.repeats
+    raise ValueError(f"Unknown benchmark: {name}")
+
+
+def run_benchmark(name, n_keywords, args, path_embedder, results):
+    # runs in a fresh process, so the memory only includes this benchmark
+    calls, n_items = setup_benchmark(name, n_keywords, args, path_embedder)
+    rss_before, _ = rss()
+    reset_peak_rss()
+
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    _, peak = rss()
+    results.put({
+        "benchmark": name,
+        "n_keywords": n_keywords,
+        "n_calls": len(calls),
+        "items_per_second": n_items / sum(latencies),
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p90": float(np.percentile(latencies, 90)),
+        "latency_p99": float(np.percentile(latencies, 99)),
+        "peak_rss_mb": peak,
+        "rss_increase_mb": peak - rss_before
+    })
+
+
+# sif_embedding, distances and categorize are timed per batch of keywords, the others per call on all keywords
+BENCHMARKS = ["sif_embedding", "fit", "load", "load_npz", "distances", "categorize", "closest_keywords"]
+
+
+def git_commit():
+    """
+    The current git commit of the repository, or None if it is not known.
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode("utf8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main_run(args):
+    context = multiprocessing.get_context("spawn")
+    output = {
+        "metadata": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "arguments": vars(args)
+        },
+        "results": []
+    }
+    print("benchmark\tn_keywords\titems/s\tp50 [s]\tp90 [s]\tp99 [s]\tpeak RSS [MB]")
+    with tempfile.TemporaryDirectory() as directory:
+        for n_keywords in args.sizes:
+            # fit the embedder used by the other benchmarks once per size
+            vocabulary = [f"word{word_i}" for word_i in range(args.n_words)]
+            embedder = ck.SIFEmbedder(SyntheticModel(vocabulary, dimension=args.n_dimensions, seed=args.seed))
+            embedder.fit(synthetic_keywords(n_keywords, args.n_words, args.seed))
+            path_embedder = os.path.join(directory, f"embedder-{n_keywords}")
+            embedder.save_file(path_embedder + ".json")
+            embedder.save_file(path_embedder + ".npz")
+            del embedder
+
+            for name in args.benchmarks:
+                results = context.Queue()
+                process = context.Process(target=run_benchmark, args=(name, n_keywords, args, path_embedder, results))
+                process.start()
+                result = results.get()
+                process.join()
+                output["results"].append(result)
+                print(f"{name}\t{n_keywords}\t{result['items_per_second']:.0f}\t{result['latency_p50']:.4f}\t"
+                      f"{result['latency_p90']:.4f}\t{result['latency_p99']:.4f}\t{result['peak_rss_mb']:.1f}")
+
+    with open(args.path_output, "w") as outfile:
+        json.dump(output, outfile, indent=2)
+    print(f"Results written to: {args.path_output}")
+
+
+def main_compare(args):
+    with open(args.path_baseline) as infile:
+        baseline = json.load(infile)
+    with open(args.path_results) as infile:
+        current = json.load(infile)
+    print(f"Comparing {current['metadata']['commit']} to baseline {baseline['metadata']['commit']}")
+
+    baseline_results = {(result["benchmark"], result["n_keywords"]): result for result in baseline["results"]}
+    n_regressions = 0
+    print("benchmark\tn_keywords\titems/s change\tp50 change\tpeak RSS change")
+    for result in current["results"]:
+        key = (result["benchmark"], result["n_keywords"])
+        if key not in baseline_results:
+            continue
+        base = baseline_results[key]
+        throughput = result["items_per_second"] / base["items_per_second"] - 1.
+        latency = result["latency_p50"] / base["latency_p50"] - 1.
+        memory = result["peak_rss_mb"] / base["peak_rss_mb"] - 1.
+        regression = throughput < -args.threshold or memory > args.threshold
+        n_regressions += regression
+        print(f"{key[0]}\t{key[1]}\t{100 * throughput:+.1f}%\t{100 * latency:+.1f}%\t{100 * memory:+.1f}%"
+              + ("\tREGRESSION" if regression else ""))
+    print(f"{n_regressions} regressions (threshold {100 * args.threshold:.0f}%)")
+    return n_regressions
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description='Benchmark of the keyword clustering hot paths on synthetic data.')
+    subparsers = argparser.add_subparsers(help='Run the benchmarks or compare two results files.')
+
+    argparser_run = subparsers.add_parser('run', help='Run the benchmarks and store the results.')
+    argparser_run.add_argument('path_output', type=str, help='Path to the output json file.')
+    argparser_run.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='Numbers of keywords to benchmark. (default: 10000 100000)')
+    argparser_run.add_argument('--benchmarks', type=str, nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help='Benchmarks to run. (default: all)')
+    argparser_run.add_argument('--n_words', type=int, default=50000, help='Size of the vocabulary. (default: 50000)')
+    argparser_run.add_argument('--n_dimensions', type=int, default=300, help='Dimension of the word vectors. (default: 300)')
+    argparser_run.add_argument('--n_categories', type=int, default=1000, help='Number of categories. (default: 1000)')
+    argparser_run.add_argument('--k', type=int, default=3, help='Number of closest categories per keyword. (default: 3)')
+    argparser_run.add_argument('--n_closest_keywords', type=int, default=1000, help='Number of closest keywords per category. (default: 1000)')
+    argparser_run.add_argument('--batch_size', type=int, default=1000, help='Number of keywords per call of the batched benchmarks. (default: 1000)')
+    argparser_run.add_argument('--repeats', type=int, default=3, help='Number of calls of the other benchmarks. (default: 3)')
+    argparser_run.add_argument('--word_vectors', action='store_true', help='Look up the word vectors in a WordVectors store instead of the model.')
+    argparser_run.add_argument('--seed', type=int, default=0, help='Random seed. (default: 0)')
+    argparser_run.set_defaults(command='run')
+
+    argparser_compare = subparsers.add_parser('compare', help='Compare results to a baseline, e.g. from another commit.')
+    argparser_compare.add_argument('path_baseline', type=str, help='Path to the baseline results json file.')
+    argparser_compare.add_argument('path_results', type=str, help='Path to the results json file.')
+    argparser_compare.add_argument('--threshold', type=float, default=0.1, help='Relative throughput drop or memory increase reported as a regression. (default: 0.1)')
+    argparser_compare.set_defaults(command='compare')
+
+    args = argparser.parse_args()
+
+    if args.command == 'run':
+        main_run(args)
+    elif args.command == 'compare':
+        sys.exit(1 if main_compare(args) else 0)
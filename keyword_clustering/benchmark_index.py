@@ -0,0 +1,76 @@
+# Developed in Python 3.6.7
+
+# Code for comparing approximate nearest neighbour search in cluster_keywords.py against exact search.
+
+import argparse
+import time
+
+import numpy as np
+
+import cluster_keywords as ck
+
+
+def synthetic_embeddings(n_items, n_dimensions, n_topics, random_state):
+    """
+    Generate embeddings grouped around random topic directions, similar to keyword embeddings.
+
+    Args:
+        n_items: Number of embeddings.
+        n_dimensions: Dimension of the embeddings.
+        n_topics: Number of topic directions.
+        random_state: numpy RandomState object.
+
+    Returns:
+        A numpy array of dimensions n_items x n_dimensions.
+    """
+    topics = random_state.randn(n_topics, n_dimensions)
+    assignments = random_state.randint(n_topics, size=n_items)
+    return topics[assignments] + 0.5 * random_state.randn(n_items, n_dimensions)
+
+
+def main_benchmark(args):
+    random_state = np.random.RandomState(args.seed)
+    # queries come from the same topics as the indexed embeddings
+    embeddings = synthetic_embeddings(args.n_items + args.n_queries, args.n_dimensions, args.n_topics, random_state)
+    embeddings, queries = embeddings[:args.n_items], embeddings[args.n_items:]
+    queries = queries / np.linalg.norm(queries, ord=2, axis=-1, keepdims=True)
+    print(f"Indexing {args.n_items} items, searching for {args.n_queries} queries, k={args.k}")
+
+    # exact search is the reference
+    exact_index = ck.ExactIndex()
+    exact_index.fit(embeddings)
+    start = time.time()
+    exact_ids, _ = exact_index.search(queries, args.k)
+    exact_time = time.time() - start
+
+    start = time.time()
+    ivf_index = ck.IVFIndex(n_lists=args.n_lists)
+    ivf_index.fit(embeddings)
+    print(f"Built ivf index with {ivf_index.n_lists} lists in {time.time() - start:.2f}s")
+
+    print("method\tn_probe\trecall@k\tms/query")
+    print(f"exact\t-\t1.000\t{1000 * exact_time / args.n_queries:.3f}")
+    for n_probe in args.n_probe:
+        start = time.time()
+        ivf_ids, _ = ivf_index.search(queries, args.k, n_probe=n_probe)
+        ivf_time = time.time() - start
+        recall = ck.recall_at_k(exact_ids, ivf_ids)
+        print(f"ivf\t{n_probe}\t{recall:.3f}\t{1000 * ivf_time / args.n_queries:.3f}")
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description='Benchmark of approximate nearest neighbour search against exact search.')
+
+    argparser.add_argument('--n_items', type=int, default=100000, help='Number of indexed embeddings. (default: 100000)')
+    argparser.add_argument('--n_queries', type=int, default=1000, help='Number of queries. (default: 1000)')
+    argparser.add_argument('--n_dimensions', type=int, default=300, help='Dimension of the embeddings. (default: 300)')
+    argparser.add_argument('--n_topics', type=int, default=1000, help='Number of groups in the synthetic embeddings. (default: 1000)')
+    argparser.add_argument('--k', type=int, default=10, help='Number of closest items to return. (default: 10)')
+    argparser.add_argument('--n_lists', type=int, default=None, help='Number of clusters of the ivf index. (default: square root of n_items)')
+    argparser.add_argument('--n_probe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help='Values of n_probe to benchmark. (default: 1 2 4 8 16 32)')
+    argparser.add_argument('--seed', type=int, default=0, help='Random seed. (default: 0)')
+
+    args = argparser.parse_args()
+
+    main_benchmark(args)
@@ -7,25 +7,59 @@ import json
 import csv
 import re
 import argparse
+import os
 import pdb
 
 from tqdm import tqdm
 
 
+def load_index(args, embedder, items):
+    """
+    Load the search index given by the command line arguments if it was built over the items with the embedder,
+    or create a new one. Returns None for exact search.
+    """
+    if args.index == 'exact':
+        return None
+    index = None
+    if args.path_index is not None and os.path.isfile(args.path_index + ".json"):
+        index = ck.load_index(args.path_index)
+        if index.key == ck.index_key(embedder, items):
+            print(f"Loaded index from: {args.path_index}")
+        else:
+            print(f"Index in {args.path_index} was built over other items or embedder parameters, building a new one")
+            index = None
+    if index is None:
+        index = ck.IVFIndex(n_lists=args.n_lists, dtype=args.storage_dtype)
+    if args.n_probe is not None:
+        index.n_probe = args.n_probe
+    return index
+
+
+def save_index(args, index, loaded_key):
+    """Store the search index if it was built in this run and a path is given."""
+    if index is not None and args.path_index is not None and index.key != loaded_key:
+        print(f"Dumping index to: {args.path_index}")
+        index.save(args.path_index)
+
+
 def main_categorise(args):
     # load language model
     ft_model_filename = args.path_model
-    print(f"Loading language model from: {ft_model_filename}")
-    model = ck.load_FT_model(ft_model_filename)
+    if args.path_word_vectors is not None:
+        # the FastText model is loaded only when an unknown word is encountered
+        print(f"Loading word vectors from: {args.path_word_vectors}")
+        model = ck.WordVectors.load(args.path_word_vectors, path_model=ft_model_filename)
+    else:
+        print(f"Loading language model from: {ft_model_filename}")
+        model = ck.load_FT_model(ft_model_filename)
     print("Loaded embeddings!")
 
 
     # build embedder
     embedder_parameters_filename = args.path_embedder_parameters
     print(f"Loading embedder parameters from: {embedder_parameters_filename}")
-    de_embedder_parameters_json = open(embedder_parameters_filename).read()
-    de_embedder = ck.SIFEmbedder(model)
-    de_embedder.load(de_embedder_parameters_json)
+    de_embedder = ck.SIFEmbedder(model, dtype=args.dtype)
+    de_embedder.load_file(embedder_parameters_filename)
     print("Built embedder!")
 
 
@@ -38,27 +72,42 @@ def main_categorise(args):
 
 
     # build categorizer
-    categorizer = ck.Categorizer(de_embedder)
+    if args.mode == "categorise_keywords":
+        # the index is built over the categories
+        index = load_index(args, de_embedder, categories)
+        loaded_key = None if index is None else index.key
+        categorizer = ck.Categorizer(de_embedder, index=index, cache_dir=args.cache_dir, storage_dtype=args.storage_dtype,
+            memory_budget=None if args.memory_budget is None else args.memory_budget * 2 ** 20)
+    else:
+        categorizer = ck.Categorizer(de_embedder, cache_dir=args.cache_dir, storage_dtype=args.storage_dtype,
+            memory_budget=None if args.memory_budget is None else args.memory_budget * 2 ** 20)
     categorizer.fit(categories, category_ids=category_ids)
     print("Categorizer built!")
 
 
-    # get keywords
     keyword_filename = args.path_keywords
-    print(f"Loading keywords from: {keyword_filename}")
-    keywords = ck.load_csv_column(
-        keyword_filename,
-        args.keywords_column,
-        delimiter = args.keywords_delimiter)
-    print(f'Loaded {len(keywords)} keywords.')
-
 
     # assigning closest 'n_categories' to each keyword
     if args.mode == "categorise_keywords":
         n_categories = args.n_categories
-        keyword_categories = categorizer.categorize(keywords, n_categories=n_categories)
+        # stream the keywords in chunks, reading ahead in a background thread
+        print(f"Streaming keywords from: {keyword_filename}")
+        keyword_chunks = ck.prefetch(ck.iter_chunks(
+            ck.iter_csv_column(
+                keyword_filename,
+                args.keywords_column,
+                delimiter = args.keywords_delimiter),
+            args.chunk_size))
+        if args.workers > 1:
+            chunk_categories = ck.categorize_parallel(categorizer, keyword_chunks, n_categories=n_categories, n_workers=args.workers)
+        else:
+            # categorise the next chunk in a background thread while the current one is written
+            chunk_categories = ck.prefetch(
+                (keywords, categorizer.categorize(keywords, n_categories=n_categories))
+                for keywords in keyword_chunks)
         output_filename = args.path_output
         print(f"Writing categories to: {output_filename}")
+        n_keywords = 0
         with open(output_filename, "w", encoding="utf8") as outfile:
             outwriter = csv.writer(outfile, delimiter=",", quotechar='"')
             # write header
@@ -67,16 +116,33 @@ def main_categorise(args):
                 out_header.extend([f"category{cat_i}_id", f"category{cat_i}", f"category{cat_i}_distance"])
             outwriter.writerow(out_header)
 
-            # write results row by row
-            for keyword, categories in zip(keywords, keyword_categories):
-                row = [f"{keyword}"]
-                for category, id, distance in categories:
-                    row.extend([f"{id}", f"{category}", f"{distance}"])
-                outwriter.writerow(row)
+            # write results chunk by chunk, row by row
+            for keywords, keyword_categories in chunk_categories:
+                with ck.metrics.span("output_serialization"):
+                    for keyword, categories in zip(keywords, keyword_categories):
+                        row = [f"{keyword}"]
+                        for category, id, distance in categories:
+                            row.extend([f"{id}", f"{category}", f"{distance}"])
+                        outwriter.writerow(row)
+                n_keywords += len(keywords)
+        print(f'Categorised {n_keywords} keywords.')
+        save_index(args, index, loaded_key)
     # assigning closest 'n_keywords' to each category
     elif args.mode == "relevance_to_category":
+        # get keywords
+        print(f"Loading keywords from: {keyword_filename}")
+        keywords = ck.load_csv_column(
+            keyword_filename,
+            args.keywords_column,
+            delimiter = args.keywords_delimiter)
+        print(f'Loaded {len(keywords)} keywords.')
+
         n_keywords = args.n_keywords
-        keyword_categories = categorizer.closest_keywords(keywords, n_keywords=n_keywords)
+        # the index is built over the (lowercased) keywords
+        index = load_index(args, de_embedder, [keyword.lower() for keyword in keywords])
+        loaded_key = None if index is None else index.key
+        keyword_categories = categorizer.closest_keywords(keywords, n_keywords=n_keywords, keyword_index=index)
+        save_index(args, index, loaded_key)
         output_filename = args.path_output
         print(f"Writing categories to: {output_filename}")
         with open(output_filename, "w", encoding="utf8") as outfile:
@@ -86,14 +152,18 @@ def main_categorise(args):
             outwriter.writerow(out_header)
             
             # write results row by row
-            for keyword, categories in tqdm(zip(keywords, keyword_categories), desc='Writting to file'):
-                row = [f"{keyword}"]
-                if len(categories) == 0:
-                    row += ["none"]
-                else:
-                    row += [",".join([f"{category}({id})" for category, id, distance in categories])]
-                outwriter.writerow(row)
+            with ck.metrics.span("output_serialization"):
+                for keyword, categories in tqdm(zip(keywords, keyword_categories), desc='Writting to file'):
+                    row = [f"{keyword}"]
+                    if len(categories) == 0:
+                        row += ["none"]
+                    else:
+                        row += [",".join([f"{category}({id})" for category, id, distance in categories])]
+                    outwriter.writerow(row)
                 
+    if args.profile:
+        print("Profile:")
+        print(ck.metrics.report())
     print("DONE!")
 
 
@@ -103,7 +173,7 @@ if __name__ == '__main__':
 
     argparser.add_argument('mode', type=str, choices=['categorise_keywords', 'relevance_to_category'], help='Categorization mode.')
     argparser.add_argument('path_model', type=str, help='Path to the FastText model binary file.')
-    argparser.add_argument('path_embedder_parameters', type=str, help='Path to the embedder parameters json file.')
+    argparser.add_argument('path_embedder_parameters', type=str, help='Path to the embedder parameters file (.json or binary .npz).')
     argparser.add_argument('path_categories', type=str, help='Path to the categories file.')
     argparser.add_argument('path_keywords', type=str, help='Path to the input keywords csv file.')
     argparser.add_argument('path_output', type=str, help='Path to the output csv file.')
@@ -112,6 +182,18 @@ if __name__ == '__main__':
     argparser.add_argument('--categories_delimiter', '-cd', type=str, default=',', help='Delimiter used in the categories csv file. (default: \',\')')
     argparser.add_argument('--categories_column', '-cc', type=str, default='Category', help='Name of column containing categories in the categories csv file. (default: \'Category\')')
     argparser.add_argument('--categories_id_column', '-cic', type=str, default='CategoryID', help='Name of column containing category ids in the categories csv file. (default: \'CategoryID\')')
+    argparser.add_argument('--path_word_vectors', '-wv', type=str, default=None, help='Path prefix of the word vectors store built with `embedder.py vectors`. If set, the FastText model is only loaded for unknown words. (default: None)')
+    argparser.add_argument('--cache_dir', type=str, default=None, help='Directory where category embeddings are cached between runs. (default: None)')
+    argparser.add_argument('--dtype', type=str, choices=['float32', 'float64'], default='float32', help='Floating point type in which keyword embeddings and distances are computed. (default: float32)')
+    argparser.add_argument('--storage_dtype', type=str, choices=['float32', 'float16'], default='float32', help='Floating point type in which category embeddings are cached and indexed. (default: float32)')
+    argparser.add_argument('--memory_budget', type=int, default=None, help='Memory in MB for the blocks of embeddings and distances compared at once in exact search. (default: 256, or less to fit the blocks in the CPU cache)')
+    argparser.add_argument('--profile', action='store_true', help='Print the time spent in each stage and the keyword and out-of-vocabulary word counts at the end.')
+    argparser.add_argument('--index', type=str, choices=['exact', 'ivf'], default='exact', help='Nearest neighbour search method: exact or approximate (inverted file index). (default: exact)')
+    argparser.add_argument('--path_index', type=str, default=None, help='Path prefix of the index files. Loaded if it exists and was built over the same items with the same embedder parameters, otherwise the built index is stored there. (default: None)')
+    argparser.add_argument('--n_lists', type=int, default=None, help='Number of clusters of a new ivf index. (default: square root of the number of indexed items)')
+    argparser.add_argument('--n_probe', type=int, default=None, help='Number of clusters searched by the ivf index. Higher is more exact and slower. (default: 8)')
+    argparser.add_argument('--workers', '-w', type=int, default=1, help='Number of worker processes used in categorise_keywords mode. (default: 1)')
+    argparser.add_argument('--chunk_size', type=int, default=10000, help='Number of keywords read, categorised and written at once in categorise_keywords mode. (default: 10000)')
     argparser.add_argument('--keywords_delimiter', '-kd', type=str, default=',', help='Delimiter used in the keywords csv file. (default: \',\')')
     argparser.add_argument('--keywords_column', '-kc', type=str, default='Keyword', help='Name of column containing keywords in the keywords csv file. (default: \'Keyword\')')
 
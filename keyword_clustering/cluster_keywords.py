@@ -5,18 +5,142 @@
 # FastText word vectors: https://fasttext.cc/docs/en/crawl-vectors.html
 
 import json
+import array
+import os
 import re
+import hashlib
+import itertools
 import csv
+import glob
 import random
-
-from collections import Counter
+import zipfile
+import multiprocessing
+import queue
+import threading
+import time
+import sys
+
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
 
 import fasttext
 import numpy as np
 from tqdm import tqdm
 
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.sparse import csr_matrix
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.decomposition import TruncatedSVD
 
+try:
+    import numba
+except ImportError:
+    # the compiled kernel of weighted_average is optional
+    numba = None
+
+
+class Metrics(object):
+    """
+    Timing spans and counters of the hot paths (model loading, tokenization, embedding, distances, ...),
+    collected in production runs without a profiler. Safe to use from several threads.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = {}                     # span name -> [number of spans, total seconds]
+        self.counters = {}                  # counter name -> value
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time the enclosed block of code as a span with the given name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            span = self.spans.setdefault(name, [0, 0.])
+            span[0] += 1
+            span[1] += seconds
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        Return a copy of the spans and counters, e.g. to send them from a worker process.
+        """
+        with self.lock:
+            return {"spans": {name: list(span) for name, span in self.spans.items()}, "counters": dict(self.counters)}
+
+    def merge(self, snapshot):
+        """
+        Add the spans and counters of a snapshot (e.g. from a worker process).
+        """
+        with self.lock:
+            for name, (count, seconds) in snapshot["spans"].items():
+                span = self.spans.setdefault(name, [0, 0.])
+                span[0] += count
+                span[1] += seconds
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+
+    def report(self):
+        """
+        Return a human readable table of the spans (sorted by total time) and counters.
+        """
+        snapshot = self.snapshot()
+        lines = ["span\tcount\ttotal [s]\tmean [ms]"]
+        for name, (count, seconds) in sorted(snapshot["spans"].items(), key=lambda span: -span[1][1]):
+            lines.append(f"{name}\t{count}\t{seconds:.3f}\t{1000 * seconds / count:.3f}")
+        lines.append("counter\tvalue")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name}\t{value}")
+        return "\n".join(lines)
+
+    def prometheus(self, prefix="keyword_clustering", gauges=None):
+        """
+        Return the spans (as summaries) and counters in the Prometheus text exposition format.
+
+        Args:
+            prefix: Prefix of the metric names. (default: "keyword_clustering")
+            gauges: A dictionary of additional current values to export, e.g. cache sizes. (default: None)
+
+        Returns:
+            String with the metrics.
+        """
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_span_seconds Time spent in the stages of the hot paths.",
+            f"# TYPE {prefix}_span_seconds summary"
+        ]
+        for name, (count, seconds) in sorted(snapshot["spans"].items()):
+            lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {count}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {seconds}')
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# metrics of this process, see Metrics
+metrics = Metrics()
+
 
 def load_FT_model(path):
     """
@@ -28,7 +152,159 @@ def load_FT_model(path):
     Returns:
         fasttext model object.
     """
-    return fasttext.load_model(path)
+    with metrics.span("model_load"):
+        return fasttext.load_model(path)
+
+
+class WordVectors(object):
+    """
+    A compact, memory-mapped store of word vectors for a fixed vocabulary.
+
+    Can be used in place of the FastText model. Words not present in the store are
+    looked up in the FastText model, which is only loaded on the first such lookup.
+    """
+    def __init__(self, words, vectors, path_model=None, model=None):
+        """
+        Initialize the store.
+
+        Args:
+            words: A list of words (str), the i-th word corresponds to the i-th row of vectors.
+            vectors: A numpy array (float32 or float16) of word vectors.
+            path_model: Path to FastText model binary file used for out-of-vocabulary words. (default: None)
+            model: Already loaded FastText model used for out-of-vocabulary words. (default: None)
+        """
+        self.word2id = {word: i for i, word in enumerate(words)}
+        self.vectors = vectors
+        self.path_model = path_model
+        self.model = model
+
+    def _fallback_model(self):
+        if self.model is None:
+            if self.path_model is None:
+                raise KeyError("Word not in word vectors store and no FastText model to fall back to.")
+            print(f"Loading language model for out-of-vocabulary words from: {self.path_model}")
+            self.model = load_FT_model(self.path_model)
+        return self.model
+
+    def get_dimension(self):
+        return self.vectors.shape[1]
+
+    def get_word_vector(self, word):
+        """
+        Get the vector of a single word, falling back to the FastText model for unknown words.
+        """
+        if word in self.word2id:
+            return self.vectors[self.word2id[word]].astype(np.float32)
+        return self._fallback_model().get_word_vector(word)
+
+    def get_word_vectors(self, words):
+        """
+        Get the vectors of a list of words in a single gather from the store.
+
+        Args:
+            words: A list of words (str).
+
+        Returns:
+            A float32 numpy array with one row per word.
+        """
+        ids = np.array([self.word2id.get(word, -1) for word in words], dtype=np.int64)
+        in_store = ids >= 0
+        word_vectors = np.zeros((len(words), self.get_dimension()), dtype=np.float32)
+        word_vectors[in_store] = self.vectors[ids[in_store]]
+        for word_i in np.flatnonzero(~in_store):
+            word_vectors[word_i] = self._fallback_model().get_word_vector(words[word_i])
+        return word_vectors
+
+    def save(self, path):
+        """
+        Save the store as a numpy array of vectors (``path``.npy) and a vocabulary file (``path``.vocab).
+
+        Args:
+            path: Path prefix of the store files.
+        """
+        words = sorted(self.word2id, key=self.word2id.get)
+        np.save(path + ".npy", np.asarray(self.vectors))
+        with open(path + ".vocab", "w", encoding="utf8") as outfile:
+            for word in words:
+                outfile.write(word + "\n")
+
+    @classmethod
+    def load(cls, path, path_model=None):
+        """
+        Load a store saved with save. The vectors are memory-mapped, so several processes share one copy.
+
+        Args:
+            path: Path prefix of the store files.
+            path_model: Path to FastText model binary file used for out-of-vocabulary words. (default: None)
+
+        Returns:
+            WordVectors object.
+        """
+        with metrics.span("model_load"):
+            vectors = np.load(path + ".npy", mmap_mode="r")
+            with open(path + ".vocab", encoding="utf8") as infile:
+                words = infile.read().split("\n")[:-1]
+            return cls(words, vectors, path_model=path_model)
+
+    @classmethod
+    def build(cls, model, words, dtype=np.float32):
+        """
+        Build a store by looking up vectors of the given words in a FastText model.
+
+        Args:
+            model: FastText model with get_word_vector function.
+            words: A list of words (str) - usually the words in SIFEmbedder.word_frequencies.
+            dtype: Storage type of the vectors, np.float32 or np.float16. (default: np.float32)
+
+        Returns:
+            WordVectors object.
+        """
+        words = list(words)
+        vectors = np.zeros((len(words), model.get_dimension()), dtype=dtype)
+        for word_i, word in enumerate(tqdm(words, desc='Building word vectors')):
+            vectors[word_i] = model.get_word_vector(word)
+        return cls(words, vectors, model=model)
+
+
+# words whose vectors identify a FastText model in model_fingerprint
+FINGERPRINT_WORDS = ["the", "of", "and", "in", "to", "a", "is", "for"]
+
+
+def model_fingerprint(model):
+    """
+    Identify the word vectors of a FastText model or a WordVectors store by the vectors of a few words, e.g. to
+    key cached embeddings computed with them.
+
+    Args:
+        model: FastText model with get_word_vector function, or a WordVectors store.
+
+    Returns:
+        String with a hash of the word vectors.
+    """
+    fingerprint = hashlib.sha1(str(model.get_dimension()).encode("utf8"))
+    if isinstance(model, WordVectors):
+        # the first words of the store, and the FastText model of the words outside of it
+        words = list(itertools.islice(model.word2id, len(FINGERPRINT_WORDS)))
+        fingerprint.update(json.dumps([len(model.word2id), words, model.path_model]).encode("utf8"))
+        fingerprint.update(np.ascontiguousarray(model.vectors[:len(words)], dtype=np.float32).tobytes())
+    else:
+        for word in FINGERPRINT_WORDS:
+            fingerprint.update(np.ascontiguousarray(model.get_word_vector(word), dtype=np.float32).tobytes())
+    return fingerprint.hexdigest()
+
+
+def clean_category(category_name):
+    """
+    Turn a category name (e.g. '/Apparel/Footwear & Shoes') into the lowercase phrase that is embedded for it.
+
+    Args:
+        category_name: Category name (str).
+
+    Returns:
+        Cleaned category name (str).
+    """
+    category_name = category_name.replace("/", " ").replace("&", " ")
+    return re.sub(" +", " ", category_name.strip().lower())
 
 
 def tokenize(keyword):
@@ -44,6 +320,48 @@ def tokenize(keyword):
     return fasttext.tokenize(keyword)
 
 
+# whitespace the FastText tokenizer splits on, apart from the newline, which is also a token of its own
+_WHITESPACE = re.compile("[ \t\r\v\f\0]+")
+
+
+def normalize_keyword(keyword, lowercase=True):
+    """
+    Normalize a keyword to the key under which it is embedded: lowercase it and collapse runs of whitespace
+    into single spaces, which does not change its tokens.
+
+    Args:
+        keyword: Keyword string.
+        lowercase: Flag to lowercase the keyword. (default: True)
+
+    Returns:
+        Normalized keyword string.
+    """
+    if lowercase:
+        keyword = keyword.lower()
+    return _WHITESPACE.sub(" ", keyword).strip(" ")
+
+
+def deduplicate_keywords(keywords, lowercase=True):
+    """
+    Map keywords to their distinct normalized keys (see normalize_keyword), so that case variants, whitespace
+    variants and repeats of a keyword are embedded and searched for only once.
+
+    Args:
+        keywords: List of keywords strings.
+        lowercase: Flag to lowercase the keywords. (default: True)
+
+    Returns:
+        Tuple (keys, inverse) of the distinct keys in order of first appearance (list of str) and the index of
+        the key of each keyword (numpy int array), i.e. ``keywords[i]`` normalizes to ``keys[inverse[i]]``.
+        Results computed for the keys are scattered back to the keywords by indexing with inverse.
+    """
+    key2id = {}
+    inverse = np.fromiter(
+        (key2id.setdefault(normalize_keyword(keyword, lowercase), len(key2id)) for keyword in keywords),
+        dtype=np.int64, count=len(keywords))
+    return list(key2id), inverse
+
+
 def count_word_frequencies(keywords):
     """
     Counts frequencies of words over all given keywords.
@@ -60,9 +378,9 @@ def count_word_frequencies(keywords):
     return dict(word_frequencies)
 
 
-def load_csv_column(path, column_name, delimiter=',', errors='raise'):
+def iter_csv_column(path, column_name, delimiter=',', errors='raise'):
     """
-    Load the contents of a column in a csv file.
+    Iterate over the contents of a column in a csv file without loading the whole file.
 
     Args:
         path: Path to the csv file containing the column.
@@ -70,11 +388,10 @@ def load_csv_column(path, column_name, delimiter=',', errors='raise'):
         column_name: The name of the target column.
 
     Returns:
-        A list of column fields as strings.
+        A generator of column fields as strings.
     """
     assert errors in ['skip', 'raise']
 
-    fields = []
     n_skip = 0
     # go over all the csv rows
     with open(path, encoding="utf8") as csv_file:
@@ -88,33 +405,434 @@ def load_csv_column(path, column_name, delimiter=',', errors='raise'):
             else:
                 # get the correct field
                 try:
-                    fields.append(row[column_index])
+                    field = row[column_index]
                 except Exception as e:
                     print("\n!!! ERROR !!!\nRow[%d]: %s\n" % (line_count, row))
                     n_skip += 1
                     if errors == 'raise':
                         raise e
+                else:
+                    yield field
 
             line_count += 1
 
     if n_skip > 0:
         print("Rows skipped: %d/%d " % (n_skip, line_count))
-    return fields
+
+
+def load_csv_column(path, column_name, delimiter=',', errors='raise'):
+    """
+    Load the contents of a column in a csv file.
+
+    Args:
+        path: Path to the csv file containing the column.
+        delimiter: The delimiter used in the csv file.
+        column_name: The name of the target column.
+
+    Returns:
+        A list of column fields as strings.
+    """
+    return list(iter_csv_column(path, column_name, delimiter=delimiter, errors=errors))
+
+
+def iter_chunks(iterable, chunk_size):
+    """
+    Split an iterable into lists of (at most) chunk_size items.
+
+    Args:
+        iterable: Any iterable, e.g. the generator returned by iter_csv_column.
+        chunk_size: Number of items in a chunk.
+
+    Returns:
+        A generator of lists of items.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def prefetch(iterable, size=2):
+    """
+    Iterate over an iterable in a background thread, so that producing the next items (e.g. reading
+    or computing them) overlaps with processing the current one. At most ``size`` items are kept ready.
+
+    Args:
+        iterable: Any iterable.
+        size: Maximal number of items produced in advance. (default: 2)
+
+    Returns:
+        A generator of the items of the iterable.
+    """
+    items = queue.Queue(maxsize=size)
+    done = object()
+    error = []
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as e:
+            error.append(e)
+        finally:
+            items.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            break
+        yield item
+    if len(error) > 0:
+        raise error[0]
+
+
+class WordTable(Mapping):
+    """
+    A read-only word to value mapping stored in two numpy arrays: sorted utf-8 encoded words and their values.
+    Used for the word frequencies and weights of embedder parameters loaded from the binary (.npz) format,
+    so the (possibly memory-mapped) arrays never have to be turned into dictionaries.
+    """
+    def __init__(self, words, values):
+        """
+        Initialize the table.
+
+        Args:
+            words: A sorted numpy array of utf-8 encoded words (dtype 'S').
+            values: A numpy array of values, the i-th value belongs to the i-th word.
+        """
+        self.words = words
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, word_values, dtype):
+        """
+        Build a table from a word to value dictionary.
+        """
+        words = np.array(sorted(word.encode("utf8") for word in word_values), dtype=bytes)
+        values = np.array([word_values[word.decode("utf8")] for word in words], dtype=dtype)
+        return cls(words, values)
+
+    def _find(self, encoded_words):
+        positions = np.minimum(np.searchsorted(self.words, encoded_words), max(len(self.words) - 1, 0))
+        return positions, self.words[positions] == encoded_words
+
+    def lookup(self, words, default, return_found=False):
+        """
+        Look up the values of a list of words at once.
+
+        Args:
+            words: A list of words (str).
+            default: Value of the words not in the table.
+            return_found: Flag to return also which of the words are in the table. (default: False)
+
+        Returns:
+            A numpy array of values. If return_found is True, also a boolean numpy array marking the words in the table.
+        """
+        values = np.full(len(words), default, dtype=self.values.dtype)
+        found = np.zeros(len(words), dtype=bool)
+        if len(words) > 0 and len(self.words) > 0:
+            positions, found = self._find(np.array([word.encode("utf8") for word in words], dtype=bytes))
+            values[found] = self.values[positions[found]]
+        if return_found:
+            return values, found
+        return values
+
+    def __getitem__(self, word):
+        if len(self.words) > 0:
+            positions, found = self._find(np.array([word.encode("utf8")], dtype=bytes))
+            if found[0]:
+                return self.values[positions[0]].item()
+        raise KeyError(word)
+
+    def __iter__(self):
+        return (word.decode("utf8") for word in self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def items(self):
+        return zip(iter(self), self.values.tolist())
+
+
+def _load_npz(path):
+    """
+    Load the arrays from an .npz file. Arrays stored without compression are memory-mapped, others are read.
+
+    Args:
+        path: Path to the .npz file.
+
+    Returns:
+        A dictionary of numpy arrays.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as npz_file, open(path, "rb") as raw_file:
+        for info in npz_file.infolist():
+            name = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                with npz_file.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            # skip the local file header to the start of the .npy data
+            raw_file.seek(info.header_offset)
+            local_header = raw_file.read(30)
+            name_length = int.from_bytes(local_header[26:28], "little")
+            extra_length = int.from_bytes(local_header[28:30], "little")
+            raw_file.seek(info.header_offset + 30 + name_length + extra_length)
+            if np.lib.format.read_magic(raw_file) == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(raw_file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(raw_file)
+            if dtype.hasobject or 0 in shape:
+                raw_file.seek(info.header_offset + 30 + name_length + extra_length)
+                arrays[name] = np.lib.format.read_array(raw_file)
+            else:
+                arrays[name] = np.memmap(raw_file.name, dtype=dtype, mode="r", offset=raw_file.tell(),
+                                         shape=shape, order="F" if fortran_order else "C")
+    return arrays
+
+
+def tokenize_keywords(keywords):
+    """
+    Tokenizes a list of keywords into a flat array of token ids.
+
+    The tokens of the i-th keyword are ``token_ids[offsets[i]:offsets[i + 1]]``
+    and each token id indexes into the returned list of distinct words.
+
+    Args:
+        keywords: List of keywords strings.
+
+    Returns:
+        Tuple (words, token_ids, offsets) of the distinct words (list of str), token ids
+        (numpy int array) and keyword offsets into token ids (numpy int array of length len(keywords) + 1).
+    """
+    word2id = {}
+    token_ids = array.array('q')
+    offsets = np.zeros(len(keywords) + 1, dtype=np.int64)
+    with metrics.span("tokenization"):
+        for i, keyword in enumerate(tqdm(keywords, desc='Tokenizing', leave=False)):
+            for word in tokenize(keyword):
+                token_ids.append(word2id.setdefault(word, len(word2id)))
+            offsets[i + 1] = len(token_ids)
+
+    words = list(word2id)
+    return words, np.frombuffer(token_ids, dtype=np.int64), offsets
+
+
+class TokenizedKeywords(object):
+    """
+    Keywords tokenized once into integer token ids, stored CSR-style: the tokens of the i-th keyword are
+    ``words[token_ids[offsets[i]:offsets[i + 1]]]``. Can be passed wherever a list of keywords is embedded
+    (sif_embedding, SIFEmbedder, Categorizer), so the keywords are never tokenized again.
+    """
+    def __init__(self, keywords=None, words=None, token_ids=None, offsets=None):
+        """
+        Tokenize the keywords, or wrap already tokenized ones.
+
+        Args:
+            keywords: A list of keywords (str) to tokenize. (default: None)
+            words: A list of distinct words (str), if keywords is None. (default: None)
+            token_ids: A numpy array of token ids (indices into words), if keywords is None. (default: None)
+            offsets: A numpy array of keyword offsets into token_ids, if keywords is None. (default: None)
+        """
+        if keywords is not None:
+            words, token_ids, offsets = tokenize_keywords(keywords)
+        self.words = words
+        self.token_ids = token_ids
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """
+        Select keywords by a slice (without copying the tokens) or by an array of indices.
+        All selections share the list of words.
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("Only contiguous slices of tokenized keywords are supported.")
+            offsets = self.offsets[start:max(start, stop) + 1]
+            token_ids = self.token_ids[offsets[0]:offsets[-1]]
+            return TokenizedKeywords(words=self.words, token_ids=token_ids, offsets=offsets - offsets[0])
+
+        index = np.asarray(index, dtype=np.int64)
+        starts = self.offsets[index]
+        n_tokens = self.offsets[index + 1] - starts
+        offsets = np.zeros(len(index) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(n_tokens)
+        # position of every selected token in the original token ids
+        positions = np.repeat(starts - offsets[:-1], n_tokens) + np.arange(offsets[-1])
+        return TokenizedKeywords(words=self.words, token_ids=self.token_ids[positions], offsets=offsets)
+
+    def word_frequencies(self):
+        """
+        Count the frequencies of the words in the keywords.
+
+        Returns:
+            Dictionary of word:frequency mappings.
+        """
+        counts = np.bincount(self.token_ids, minlength=len(self.words))
+        return {word: int(count) for word, count in zip(self.words, counts.tolist()) if count > 0}
+
+
+def _remove_principal_components(embs, principal_components, normalize=False, batch_size=1000):
+    """
+    Remove (project out) the principal components from the embeddings in place, a batch of rows at a time,
+    optionally L2-normalizing each batch in the same pass. Apart from the projections and norms, only a buffer
+    for one batch is allocated. Rows of zeros become rows of nan when normalized.
+
+    Args:
+        embs: A numpy array of embeddings, modified in place.
+        principal_components: A numpy array of principal components (of the type of embs), possibly empty.
+        normalize: Flag to L2-normalize the rows after removing the components. (default: False)
+        batch_size: Number of rows processed at once. (default: 1000)
+    """
+    update = np.empty((min(batch_size, len(embs)), embs.shape[1]), dtype=embs.dtype)
+    for i in tqdm(range(0, embs.shape[0], batch_size), desc='Remove principal component', leave=False):
+        batch = embs[i:i + batch_size]
+        if len(principal_components) > 0:
+            projections = batch.dot(principal_components.transpose())
+            batch -= np.dot(projections, principal_components, out=update[:len(batch)])
+        if normalize:
+            batch /= np.sqrt(np.einsum("ij,ij->i", batch, batch))[:, np.newaxis]
+
+
+def _weighted_average_kernel(token_ids, offsets, token_weights, word_vectors, principal_components, normalize, embs):
+    """
+    Kernel of weighted_average compiled with numba: averages the word vectors of the keywords (in parallel, if
+    compiled with parallel=True) and removes the principal components from each average (and normalizes it)
+    before moving on, so ``embs`` is only written once.
+    """
+    n_dimensions = word_vectors.shape[1]
+    n_principal_components = principal_components.shape[0]
+    for i in numba.prange(len(offsets) - 1):
+        start, end = offsets[i], offsets[i + 1]
+        row = embs[i]
+        for token in range(start, end):
+            weight = token_weights[token]
+            vector = word_vectors[token_ids[token]]
+            for j in range(n_dimensions):
+                row[j] += weight * vector[j]
+        # project out all the components of the average at once
+        projections = np.zeros(n_principal_components, dtype=embs.dtype)
+        for k in range(n_principal_components):
+            for j in range(n_dimensions):
+                projections[k] += row[j] * principal_components[k, j]
+        for k in range(n_principal_components):
+            for j in range(n_dimensions):
+                row[j] -= projections[k] * principal_components[k, j]
+        if normalize:
+            norm = 0.
+            for j in range(n_dimensions):
+                norm += row[j] * row[j]
+            if norm == 0.:
+                # a keyword without tokens has no direction, as with NumPy it becomes a row of nan
+                for j in range(n_dimensions):
+                    row[j] = np.nan
+            else:
+                norm = np.sqrt(norm)
+                for j in range(n_dimensions):
+                    row[j] /= norm
+
+
+if numba is not None:
+    # no fast math assumptions about nan and inf, so the nan rows of keywords without tokens survive
+    _weighted_average_compiled = numba.njit(
+        fastmath={"reassoc", "contract", "arcp"}, cache=True)(_weighted_average_kernel)
+    # not cached: the cache of numba is keyed by the compiled function, not the parallel flag, so the two
+    # variants would load each other
+    _weighted_average_compiled_parallel = numba.njit(
+        parallel=True, fastmath={"reassoc", "contract", "arcp"})(_weighted_average_kernel)
+
+# run the compiled kernel on all cores. Off unless KEYWORD_CLUSTERING_PARALLEL_KERNEL=1: the thread pool of numba
+# is not fork safe, so a process that ran the parallel kernel cannot fork the workers of _map_chunks
+PARALLEL_KERNEL = os.environ.get("KEYWORD_CLUSTERING_PARALLEL_KERNEL", "0") == "1"
+
+# set once the parallel kernel started the thread pool of numba in this process
+_parallel_kernel_started = False
+# set in the worker processes of _map_chunks, which never use the parallel kernel
+_in_worker = False
+
+
+def weighted_average(token_ids, offsets, word_weights, word_vectors, dtype=np.float64, principal_components=None,
+    normalize=False, compiled=None, parallel=None):
+    """
+    Computes the weighted average of word vectors for each keyword with a single sparse matrix product, or
+    with a compiled kernel if numba is installed.
+
+    Args:
+        token_ids: Flat numpy array of token ids of all keywords.
+        offsets: Numpy array of keyword offsets into token_ids (see tokenize_keywords).
+        word_weights: Numpy array of weights, one per token id.
+        word_vectors: Numpy array of word vectors, one row per token id.
+        dtype: Floating point type of the computation and of the result. (default: np.float64)
+        principal_components: A numpy array of principal components to remove from the averages. (default: None)
+        normalize: Flag to L2-normalize the averages (after removing the components). (default: False)
+        compiled: Flag to use the compiled kernel. If None, it is used whenever numba is installed. (default: None)
+        parallel: Flag to run the compiled kernel on all cores. It is never used in the worker processes of
+            _map_chunks. If None, PARALLEL_KERNEL is used. (default: None)
+
+    Returns:
+        A numpy array of keyword embeddings. Keywords without tokens get a zero embedding, or a row of nan
+        if normalized.
+    """
+    if compiled is None:
+        compiled = numba is not None
+    elif compiled and numba is None:
+        raise ImportError("The compiled kernel of weighted_average requires numba.")
+    word_vectors = word_vectors.astype(dtype, copy=False)
+    n_tokens = np.diff(offsets)
+    # divide by the number of tokens so the product directly gives the average
+    token_weights = (word_weights[token_ids] / np.repeat(n_tokens, n_tokens)).astype(dtype, copy=False)
+
+    if principal_components is None:
+        principal_components = np.zeros((0, word_vectors.shape[1]))
+    principal_components = np.ascontiguousarray(principal_components, dtype=dtype)
+
+    if compiled:
+        global _parallel_kernel_started
+        if parallel is None:
+            parallel = PARALLEL_KERNEL
+        kernel = _weighted_average_compiled
+        if parallel and not _in_worker:
+            kernel = _weighted_average_compiled_parallel
+            _parallel_kernel_started = True
+        embs = np.zeros((len(n_tokens), word_vectors.shape[1]), dtype=dtype)
+        kernel(
+            np.ascontiguousarray(token_ids, dtype=np.int64), np.ascontiguousarray(offsets, dtype=np.int64),
+            token_weights, np.ascontiguousarray(word_vectors), principal_components, normalize, embs)
+        return embs
+
+    weight_matrix = csr_matrix((token_weights, token_ids, offsets), shape=(len(n_tokens), len(word_vectors)))
+    embs = np.asarray(weight_matrix.dot(word_vectors), dtype=dtype)
+    if len(principal_components) > 0 or normalize:
+        with metrics.span("pc_removal"):
+            _remove_principal_components(embs, principal_components, normalize=normalize)
+    return embs
+
 
 def sif_embedding(keywords, model, word_frequencies, n_principal_components=1, alpha=1e-3, principal_components=None,
-    return_components=False, n_all_words=None, word2weight=None):
+    return_components=False, n_all_words=None, word2weight=None, dtype=np.float64, normalize=False):
     """
     Compute a sentence/phrase embedding using the SIF approach.
     Details in: https://openreview.net/pdf?id=SyK00v5xx
 
     Args:
-        keywords: List of keywords.
+        keywords: List of keywords (or TokenizedKeywords).
         model: FastText model with get_word_vector function.
         word_frequencies: Dictionary containing (word, frequency) maapings.
         n_principal_components: Number of principal components to remove. (default=1)
         alpha: Smoothing parameter from the SIF paper. (default=1e-3)
         principal_components: A numpy array of principal components. (default=None)
         return_components: Flag to return also the principal components. (default=False)
+        dtype: Floating point type of the computation and of the embeddings, e.g. np.float32. (default=np.float64)
+        normalize: Flag to L2-normalize the embeddings, in the same pass as removing the principal components. (default=False)
 
     Returns:
         Embeddings of keywords following the SIF principle. If return_components is True,
@@ -126,35 +844,56 @@ def sif_embedding(keywords, model, word_frequencies, n_principal_components=1, a
     if word2weight is None:
         word2weight = {word: alpha / (alpha + freq / n_all_words) for word, freq in word_frequencies.items()}
 
-    # calculate weighted average of word embeddings
-    embs = np.zeros((len(keywords), 300))
-    for i, keyword in enumerate(tqdm(keywords, desc='Average embedding', leave=False)):
-        words = tokenize(keyword)
-
-        # What should be the weight of a word not present in the training corpus (in word_frequencies table)?
-        # Pretend in only appears once - has a frequency of 1.
-        # This favours the unseen words...
+    # tokenize all keywords at once into a flat array of token ids
+    if not isinstance(keywords, TokenizedKeywords):
+        keywords = TokenizedKeywords(keywords)
+    embedding_start = time.perf_counter()
+    # only look up the words used by these keywords
+    used_ids, token_ids = np.unique(keywords.token_ids, return_inverse=True)
+    words = [keywords.words[word_id] for word_id in used_ids.tolist()]
+    offsets = keywords.offsets
+
+    # What should be the weight of a word not present in the training corpus (in word_frequencies table)?
+    # Pretend in only appears once - has a frequency of 1.
+    # This favours the unseen words...
+    unseen_word_weight = alpha / (alpha + 1 / (n_all_words + 1))
+    if isinstance(word2weight, WordTable):
+        word_weights, found = word2weight.lookup(words, default=unseen_word_weight, return_found=True)
+    else:
+        found = np.array([word in word2weight for word in words], dtype=bool)
         for word in words:
             if word not in word2weight:
-                word2weight[word] = alpha / (alpha + 1 / (n_all_words + 1))
-
-        ws = sum(word2weight[word] * model.get_word_vector(word) for word in words)
-        embs[i] = ws  / len(words)
-
-    if principal_components is None and n_principal_components > 0:
-        # calculate principal components
-        svd = TruncatedSVD(n_components=n_principal_components, n_iter=7, random_state=0)
-        svd.fit(embs)
-        principal_components = svd.components_
-
-    # remove principal components
-    if n_principal_components > 0:
-        batch_size = 1000
-        for i in tqdm(range(0, embs.shape[0], batch_size), desc='Remove principal component', leave=False):
-            if n_principal_components == 1:
-                embs[i:i + batch_size] -= embs[i:i + batch_size].dot(principal_components.transpose()) * principal_components
-            else:
-                embs[i:i + batch_size] -= embs[i:i + batch_size].dot(principal_components.transpose()).dot(principal_components)
+                word2weight[word] = unseen_word_weight
+        word_weights = np.array([word2weight[word] for word in words], dtype=np.float64)
+    metrics.increment("keywords_embedded", len(keywords))
+    metrics.increment("words", len(token_ids))
+    metrics.increment("oov_words", int(np.count_nonzero(~found[token_ids])))
+
+    # look up the vector of every distinct word only once
+    if isinstance(model, WordVectors):
+        word_vectors = model.get_word_vectors(words)
+    else:
+        word_vectors = np.zeros((len(words), model.get_dimension()), dtype=np.float32)
+        for word_i, word in enumerate(tqdm(words, desc='Average embedding', leave=False)):
+            word_vectors[word_i] = model.get_word_vector(word)
+
+    # calculate weighted average of word embeddings, removing known principal components (and normalizing)
+    # along the way
+    fused = principal_components is not None or n_principal_components == 0
+    embs = weighted_average(token_ids, offsets, word_weights, word_vectors, dtype=dtype,
+        principal_components=principal_components if fused and n_principal_components > 0 else None,
+        normalize=normalize and fused)
+    metrics.observe("embedding", time.perf_counter() - embedding_start)
+
+    if not fused:
+        with metrics.span("pc_removal"):
+            # calculate principal components
+            svd = TruncatedSVD(n_components=n_principal_components, n_iter=7, random_state=0)
+            svd.fit(embs)
+            principal_components = svd.components_
+
+            # remove principal components
+            _remove_principal_components(embs, principal_components.astype(dtype, copy=False), normalize=normalize)
 
     if return_components:
         return embs, principal_components
@@ -163,18 +902,24 @@ def sif_embedding(keywords, model, word_frequencies, n_principal_components=1, a
 
 class SIFEmbedder(object):
     """An object for fitting SIF embeddings to a set of keywords. """
-    def __init__(self, model, n_principal_components=1, alpha=1e-3):
+    def __init__(self, model, n_principal_components=1, alpha=1e-3, reservoir_size=100000, dtype=np.float32):
         """
         Initialize the embedder.
 
         Args:
-            model: FastText model of word embeddings for target language
+            model: FastText model of word embeddings for target language (or a WordVectors store)
             n_principal_components: see Args of sif_embedding above
             alpha: see Args of sif_embedding above
+            reservoir_size: Size of the uniform random sample of all keywords seen so far, which is kept
+                to recompute principal components in partial_fit. (default: 100000)
+            dtype: Floating point type of the embeddings returned by embed, np.float32 or np.float64. The principal
+                components are always computed in np.float64. (default: np.float32)
         """
         self.model = model
         self.n_principal_components = n_principal_components
         self.alpha = alpha
+        self.reservoir_size = reservoir_size
+        self.dtype = np.dtype(dtype)
 
         self.fitted = False                 # has the embedder been fit to data
         self.word_frequencies = None        # frequencies of individual words in a given set of keywords
@@ -182,7 +927,31 @@ class SIFEmbedder(object):
 
         self.n_all_words = None             # sum of all word frequencies
         self.word2weight = None             # word to weight mapping
-        
+
+        self.version = 0                    # number of fit/partial_fit calls the parameters are a result of
+        self.n_keywords = 0                 # number of keywords seen in fit/partial_fit calls
+        self.reservoir = []                 # uniform random sample of the seen keywords
+
+    def _update_word_weights(self):
+        """
+        Compute the word weights from the word frequencies.
+        """
+        self.n_all_words = float(sum(freq for _, freq in self.word_frequencies.items()))
+        self.word2weight = {word: self.alpha / (self.alpha + freq / self.n_all_words) for word, freq in self.word_frequencies.items()}
+
+    def _update_reservoir(self, keywords):
+        """
+        Add keywords to the reservoir sample (reservoir sampling, algorithm R).
+        """
+        for keyword in keywords:
+            self.n_keywords += 1
+            if len(self.reservoir) < self.reservoir_size:
+                self.reservoir.append(keyword)
+            else:
+                keyword_i = random.randrange(self.n_keywords)
+                if keyword_i < self.reservoir_size:
+                    self.reservoir[keyword_i] = keyword
+
     def fit(self, keywords, sample_size=1000000):
         """
         Fit the embedder to a set of keywords, computing the word frequencies and principal components, and embed them.
@@ -194,18 +963,23 @@ class SIFEmbedder(object):
             Embeddings of the given keywords.
         """
         # first count the word frequencies in the given keywords
-        self.word_frequencies = count_word_frequencies(keywords)
-        self.n_all_words = float(sum(freq for _, freq in self.word_frequencies.items()))
-        self.word2weight = {word: self.alpha / (self.alpha + freq / self.n_all_words) for word, freq in self.word_frequencies.items()}
+        tokenized_keywords = TokenizedKeywords(keywords)
+        self.word_frequencies = tokenized_keywords.word_frequencies()
+        self._update_word_weights()
+
+        # keep a sample of keywords for later partial_fit calls
+        self.n_keywords = 0
+        self.reservoir = []
+        self._update_reservoir(keywords)
 
         # it is enough to fit on a random sample of keywords
         if len(keywords) > sample_size:
-            print("Random sampling 1000000 keywords")
-            keywords = random.sample(keywords, sample_size)
+            print(f"Random sampling {sample_size} keywords")
+            tokenized_keywords = tokenized_keywords[sorted(random.sample(range(len(keywords)), sample_size))]
 
         # then compute the SIF embeddings (computing the principal components along the way)
         embeddings, self.principal_components = sif_embedding(
-            keywords,
+            tokenized_keywords,
             self.model,
             self.word_frequencies,
             n_principal_components = self.n_principal_components,
@@ -215,15 +989,74 @@ class SIFEmbedder(object):
             n_all_words=self.n_all_words,
             word2weight=self.word2weight)
 
+        self.version = 1
         self.fitted = True
 
 
-    def embed(self, keywords):
+    def fingerprint(self):
+        """
+        Identify the fitted parameters, e.g. to key cached embeddings computed with them.
+
+        Returns:
+            String with a hash of the embedding parameters.
+        """
+        if not self.fitted:
+            raise RuntimeError("Embedder not fitted. Nothing to identify")
+        parameters = hashlib.sha1(json.dumps([
+            self.version, self.alpha, self.n_principal_components, self.n_all_words, len(self.word_frequencies)
+        ]).encode("utf8"))
+        parameters.update(np.ascontiguousarray(self.principal_components, dtype=np.float64).tobytes())
+        return parameters.hexdigest()
+
+
+    def partial_fit(self, keywords):
+        """
+        Update the fitted embedder with new keywords. The word frequencies of the new keywords are added to
+        the existing ones and the principal components are recomputed on the reservoir sample of all
+        keywords seen so far (including the new ones).
+
+        Parameters written before the reservoir sample was stored cannot be updated: the principal components
+        would be recomputed on the new keywords alone.
+
+        Args:
+            keywords: A list of new keywords (i.e. multi-word strings) to fit to.
+        """
+        if not self.fitted:
+            raise RuntimeError("Embedder must be fitted to data before updating it.")
+        if self.n_keywords == 0 or len(self.reservoir) == 0:
+            raise ValueError("Embedder parameters do not include a sample of the keywords they were fitted to, "
+                "so they cannot be updated. Fit them again on all keywords (embedder.py build).")
+
+        # merge the word frequencies
+        word_frequencies = Counter(dict(self.word_frequencies.items()))
+        word_frequencies.update(TokenizedKeywords(keywords).word_frequencies())
+        self.word_frequencies = dict(word_frequencies)
+        self._update_word_weights()
+
+        # recompute the principal components on the updated sample
+        self._update_reservoir(keywords)
+        _, self.principal_components = sif_embedding(
+            self.reservoir,
+            self.model,
+            self.word_frequencies,
+            n_principal_components = self.n_principal_components,
+            alpha = self.alpha,
+            principal_components = None,
+            return_components = True,
+            n_all_words=self.n_all_words,
+            word2weight=self.word2weight)
+
+        self.version += 1
+
+
+    def embed(self, keywords, normalize=False):
         """
         Embed given keywords using previously fit parameters (i.e. word_frequencies and principal components).
 
         Args:
-            keywords: A list of keywords (i.e. multi-word strings) to embed.
+            keywords: A list of keywords (i.e. multi-word strings) or TokenizedKeywords to embed.
+            normalize: Flag to L2-normalize the embeddings in the same pass as removing the principal components,
+                       as needed for cosine distances. Keywords without tokens then become rows of nan. (default: False)
 
         Returns:
             Embeddings of the given keywords.
@@ -240,14 +1073,17 @@ class SIFEmbedder(object):
             principal_components = self.principal_components,
             return_components = False,
             n_all_words=self.n_all_words,
-            word2weight=self.word2weight)
+            word2weight=self.word2weight,
+            dtype=self.dtype,
+            normalize=normalize)
 
         return embeddings
 
 
     def serialize(self):
         """
-        Save the embedding parameters. Serializes word frequencies and principal components to JSON.
+        Save the embedding parameters. Serializes word frequencies, principal components, the version
+        and the reservoir sample of keywords to JSON.
         Does NOT serialize the fasttext model.
 
         Returns:
@@ -256,10 +1092,14 @@ class SIFEmbedder(object):
         if not self.fitted:
             raise RuntimeError("Embedder not fitted. Nothing to serialize")
 
-        json_string = json.dumps({
-            "word_frequencies": self.word_frequencies,
-            "principal_components": self.principal_components.tolist()
-        })
+        with metrics.span("parameter_serialization"):
+            json_string = json.dumps({
+                "version": self.version,
+                "word_frequencies": dict(self.word_frequencies.items()),
+                "principal_components": self.principal_components.tolist(),
+                "n_keywords": self.n_keywords,
+                "reservoir": self.reservoir
+            })
 
         return json_string
 
@@ -271,75 +1111,613 @@ class SIFEmbedder(object):
         Args:
             json_string: String with JSON containing fitted SIFembedder parameters.
         """
-        parameters = json.loads(json_string)
+        with metrics.span("embedder_load"):
+            parameters = json.loads(json_string)
 
-        self.word_frequencies = parameters["word_frequencies"]
-        self.n_all_words = float(sum(freq for _, freq in self.word_frequencies.items()))
-        self.word2weight = {word: self.alpha / (self.alpha + freq / self.n_all_words) for word, freq in self.word_frequencies.items()}
+            self.word_frequencies = parameters["word_frequencies"]
+            self._update_word_weights()
 
-        self.principal_components = np.array(parameters["principal_components"])
+            self.principal_components = np.array(parameters["principal_components"])
 
+            # parameters written before partial_fit was available do not have these
+            self.version = parameters.get("version", 1)
+            self.n_keywords = parameters.get("n_keywords", 0)
+            self.reservoir = parameters.get("reservoir", [])
+
+        self.fitted = True
+
+
+    def save_npz(self, path):
+        """
+        Save the embedding parameters into a binary (uncompressed .npz) file holding the sorted vocabulary,
+        word frequencies, precomputed word weights, principal components and the reservoir sample.
+        Does NOT save the fasttext model.
+
+        Args:
+            path: Path to the .npz file.
+        """
+        if not self.fitted:
+            raise RuntimeError("Embedder not fitted. Nothing to serialize")
+
+        frequencies = self.word_frequencies
+        if not isinstance(frequencies, WordTable):
+            frequencies = WordTable.from_dict(frequencies, dtype=np.int64)
+        weights = self.alpha / (self.alpha + frequencies.values / self.n_all_words)
+
+        metadata = {
+            "version": self.version,
+            "n_keywords": self.n_keywords,
+            "n_all_words": self.n_all_words,
+            "alpha": self.alpha,
+            "n_principal_components": self.n_principal_components
+        }
+        with metrics.span("parameter_serialization"), open(path, "wb") as outfile:
+            np.savez(
+                outfile,
+                metadata=np.array(json.dumps(metadata)),
+                words=frequencies.words,
+                word_frequencies=frequencies.values,
+                word_weights=weights,
+                principal_components=self.principal_components,
+                reservoir=np.array(self.reservoir, dtype=str))
+
+
+    def load_npz(self, path):
+        """
+        Load the embedding parameters from a binary file written by save_npz. The vocabulary, frequencies and
+        weights are memory-mapped and only read when needed.
+
+        Args:
+            path: Path to the .npz file.
+        """
+        with metrics.span("embedder_load"):
+            arrays = _load_npz(path)
+            metadata = json.loads(arrays["metadata"].item())
+
+            self.alpha = metadata["alpha"]
+            self.n_principal_components = metadata["n_principal_components"]
+            self.n_all_words = metadata["n_all_words"]
+            self.word_frequencies = WordTable(arrays["words"], arrays["word_frequencies"])
+            self.word2weight = WordTable(arrays["words"], arrays["word_weights"])
+
+            self.principal_components = np.array(arrays["principal_components"])
+
+            self.version = metadata["version"]
+            self.n_keywords = metadata["n_keywords"]
+            self.reservoir = arrays["reservoir"].tolist()
+
+        self.fitted = True
+
+
+    def save_file(self, path):
+        """
+        Save the embedding parameters to a file - binary if the path ends with .npz, JSON otherwise.
+        """
+        if path.endswith(".npz"):
+            self.save_npz(path)
+        else:
+            with open(path, "w") as outfile:
+                outfile.write(self.serialize())
+
+
+    def load_file(self, path):
+        """
+        Load the embedding parameters from a file - binary if the path ends with .npz, JSON otherwise.
+        """
+        if path.endswith(".npz"):
+            self.load_npz(path)
+        else:
+            with open(path) as infile:
+                self.load(infile.read())
+
+
+def _smallest_k(values, k):
+    """
+    Find the k smallest values in each row using partial sorting (the result is not sorted).
+
+    Args:
+        values: A numpy array of dimensions A x B
+        k: Number of smallest values to find in each row.
+
+    Returns:
+        A numpy array of column indices of dimensions A x min(k, B).
+    """
+    if k >= values.shape[1]:
+        return np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    return np.argpartition(values, k - 1, axis=-1)[:, :k]
+
+
+def _most_similar_k(block_sims, k):
+    """
+    Find the k most similar columns in each row of a block of cosine similarities (the result is not sorted).
+    For small k the maximum is taken k times, which is several times faster than partially sorting the block,
+    but overwrites the found similarities in ``block_sims``.
+
+    Args:
+        block_sims: A numpy array of cosine similarities of dimensions A x B.
+        k: Number of most similar columns to find in each row.
+
+    Returns:
+        Tuple of numpy arrays of column indices and cosine distances, both of dimensions A x min(k, B).
+    """
+    n_rows, n_columns = block_sims.shape
+    if k >= n_columns:
+        block_ids = np.broadcast_to(np.arange(n_columns), block_sims.shape)
+    elif k > 8:
+        block_ids = np.argpartition(block_sims, n_columns - k, axis=-1)[:, n_columns - k:]
+    else:
+        rows = np.arange(n_rows)
+        block_ids = np.zeros((n_rows, k), dtype=int)
+        block_dists = np.zeros((n_rows, k), dtype=block_sims.dtype)
+        for i in range(k):
+            block_ids[:, i] = np.argmax(block_sims, axis=-1)
+            block_dists[:, i] = 1. - block_sims[rows, block_ids[:, i]]
+            block_sims[rows, block_ids[:, i]] = -np.inf
+        return block_ids, block_dists
+    return block_ids, 1. - np.take_along_axis(block_sims, block_ids, axis=-1)
+
+
+def _merge_closest(curr_ids, curr_dists, block_sims, block_start, k):
+    """
+    Merge the k closest rows of a new block of similarities into the closest rows found so far.
+
+    Args:
+        curr_ids: A numpy array of indices of the closest rows so far (A x at most k).
+        curr_dists: A numpy array of distances of the closest rows so far (A x at most k).
+        block_sims: A numpy array of cosine similarities to a block of rows (A x B), which may be overwritten.
+        block_start: Index of the first row of the block.
+        k: Number of closest rows to keep.
+
+    Returns:
+        Tuple of indices and distances of the k closest rows (unsorted).
+    """
+    block_ids, block_dists = _most_similar_k(block_sims, k)
+    curr_ids = np.concatenate([curr_ids, block_start + block_ids], axis=-1)
+    curr_dists = np.concatenate([curr_dists, block_dists], axis=-1)
+    keep = _smallest_k(curr_dists, k)
+    return np.take_along_axis(curr_ids, keep, axis=-1), np.take_along_axis(curr_dists, keep, axis=-1)
+
+
+def _sort_closest(ids, dists):
+    """
+    Sort the closest rows by distance (ties by index).
+    """
+    order = np.lexsort((ids, dists), axis=-1)
+    return np.take_along_axis(ids, order, axis=-1), np.take_along_axis(dists, order, axis=-1)
+
+
+def _normalize(m):
+    """
+    L2-normalize the rows of a numpy array.
+    """
+    return m / np.linalg.norm(m, ord=2, axis=-1, keepdims=True)
+
+
+class ExactIndex(object):
+    """Exact (brute-force) cosine distance search over a set of embeddings."""
+    index_type = "exact"
+
+    def __init__(self, batch_size=4000, dtype="float32"):
+        """
+        Initialize the index.
+
+        Args:
+            batch_size: Number of indexed rows compared to the queries at once. (default: 4000)
+            dtype: Storage type of the indexed embeddings, "float32" or "float16". The distances are computed
+                in the type of the queries. (default: "float32")
+        """
+        self.batch_size = batch_size
+        self.dtype = np.dtype(dtype)
+
+        self.fitted = False                 # has the index been built
+        self.vectors = None                 # normalized indexed embeddings
+        self.key = None                     # identifies the indexed items and embedder parameters, see index_key
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def fit(self, embeddings):
+        """
+        Build the index over the given embeddings.
+
+        Args:
+            embeddings: A numpy array of embeddings (one row per indexed item).
+        """
+        self.vectors = _normalize(embeddings).astype(self.dtype)
+        self.fitted = True
+
+    def search(self, queries, k):
+        """
+        Find the k closest indexed rows for each of the queries.
+
+        Args:
+            queries: A numpy array of normalized query embeddings.
+            k: Number of closest rows to return.
+
+        Returns:
+            Tuple of numpy arrays of indices and cosine distances, both of dimensions len(queries) x k.
+        """
+        ids = np.zeros((len(queries), 0), dtype=int)
+        dists = np.zeros((len(queries), 0), dtype=queries.dtype)
+        for start in range(0, len(self.vectors), self.batch_size):
+            block = self.vectors[start:start + self.batch_size].astype(queries.dtype, copy=False)
+            block_sims = np.matmul(queries, block.T)
+            # rows without an embedding (e.g. empty keywords) are never the closest
+            block_sims[:, np.isnan(block[:, 0])] = -np.inf
+            ids, dists = _merge_closest(ids, dists, block_sims, start, k)
+        return _sort_closest(ids, dists)
+
+    def _arrays(self):
+        return {"vectors": self.vectors}
+
+    def _parameters(self):
+        return {"batch_size": self.batch_size, "dtype": self.dtype.name}
+
+    def save(self, path):
+        """
+        Save the index into ``path``.json (parameters) and ``path``.<array>.npy files.
+
+        Args:
+            path: Path prefix of the index files.
+        """
+        # replace the files rather than overwriting them, so an index memory-mapped from them stays readable
+        for name, values in self._arrays().items():
+            with open(f"{path}.{name}.npy.tmp", "wb") as outfile:
+                np.save(outfile, np.asarray(values))
+            os.replace(f"{path}.{name}.npy.tmp", f"{path}.{name}.npy")
+        with open(path + ".json.tmp", "w") as outfile:
+            json.dump({"type": self.index_type, "parameters": self._parameters(), "key": self.key}, outfile)
+        os.replace(path + ".json.tmp", path + ".json")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with save. The arrays are memory-mapped.
+
+        Args:
+            path: Path prefix of the index files.
+
+        Returns:
+            The loaded index.
+        """
+        with open(path + ".json") as infile:
+            meta = json.load(infile)
+        index = cls(**meta["parameters"])
+        # indexes saved before the key was stored match nothing
+        index.key = meta.get("key")
+        for name in index._arrays():
+            setattr(index, name, np.load(f"{path}.{name}.npy", mmap_mode="r"))
+        index.fitted = True
+        return index
+
+
+class IVFIndex(ExactIndex):
+    """
+    Approximate cosine distance search using an inverted file index.
+
+    The indexed embeddings are clustered with k-means and stored grouped by cluster. A query is only compared
+    to the embeddings in the ``n_probe`` clusters with the closest centroids. Increasing ``n_probe`` trades
+    speed for recall.
+    """
+    index_type = "ivf"
+
+    def __init__(self, n_lists=None, n_probe=8, batch_size=4000, dtype="float32"):
+        """
+        Initialize the index.
+
+        Args:
+            n_lists: Number of clusters. If None, the square root of the number of indexed rows. (default: None)
+            n_probe: Number of clusters searched for each query. (default: 8)
+            batch_size: Number of queries for which the clusters are selected at once. (default: 4000)
+            dtype: Storage type of the indexed embeddings, "float32" or "float16". (default: "float32")
+        """
+        super().__init__(batch_size=batch_size, dtype=dtype)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+
+        self.centroids = None               # normalized cluster centroids
+        self.list_offsets = None            # rows of the i-th cluster are vectors[list_offsets[i]:list_offsets[i + 1]]
+        self.ids = None                     # original index of each row in vectors
+
+    def fit(self, embeddings):
+        """
+        Cluster the given embeddings and build the index.
+
+        Args:
+            embeddings: A numpy array of embeddings (one row per indexed item).
+        """
+        vectors = _normalize(embeddings)
+        # rows without an embedding (e.g. empty keywords) are kept out of the clusters, after all the lists
+        embedded = ~np.isnan(vectors[:, 0])
+        n_lists = self.n_lists
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(np.count_nonzero(embedded))))
+        n_lists = max(1, min(n_lists, np.count_nonzero(embedded)))
+
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=max(1000, 4 * n_lists), random_state=0)
+        assignments = kmeans.fit_predict(vectors[embedded])
+
+        self.centroids = _normalize(kmeans.cluster_centers_).astype(self.dtype)
+        self.ids = np.concatenate([
+            np.flatnonzero(embedded)[np.argsort(assignments, kind="stable")], np.flatnonzero(~embedded)])
+        self.vectors = vectors[self.ids].astype(self.dtype)
+        self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        self.list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+        self.n_lists = n_lists
         self.fitted = True
 
+    def search(self, queries, k, n_probe=None):
+        """
+        Find (approximately) the k closest indexed rows for each of the queries.
+
+        Args:
+            queries: A numpy array of normalized query embeddings.
+            k: Number of closest rows to return.
+            n_probe: Number of clusters searched for each query. If None, use the index default. (default: None)
+
+        Returns:
+            Tuple of numpy arrays of indices and cosine distances, both of dimensions len(queries) x k.
+        """
+        if n_probe is None:
+            n_probe = self.n_probe
+        n_probe = min(n_probe, self.n_lists)
+
+        ids = np.zeros((len(queries), k), dtype=int)
+        dists = np.zeros((len(queries), k), dtype=queries.dtype)
+        centroids = self.centroids.astype(queries.dtype, copy=False)
+        list_sizes = np.diff(self.list_offsets)
+        for start in range(0, len(queries), self.batch_size):
+            batch = queries[start:start + self.batch_size]
+            probes = _smallest_k(-np.matmul(batch, centroids.T), n_probe)
+            # closest rows found so far, starting from rows at an infinite distance
+            rows = np.zeros((len(batch), k), dtype=int)
+            row_dists = np.full((len(batch), k), np.inf, dtype=queries.dtype)
+
+            # not enough candidates in the probed clusters, or a query without an embedding - compare to all rows
+            exhaustive = (list_sizes[probes].sum(axis=-1) < k) | np.isnan(batch[:, 0])
+            if exhaustive.any():
+                rows[exhaustive], row_dists[exhaustive] = ExactIndex.search(self, batch[exhaustive], k)
+
+            # group the other queries by probed cluster and compare each cluster to its queries at once
+            query_ids = np.repeat(np.flatnonzero(~exhaustive), n_probe)
+            list_ids = probes[~exhaustive].reshape(-1)
+            order = np.argsort(list_ids, kind="stable")
+            query_ids, list_ids = query_ids[order], list_ids[order]
+            bounds = np.searchsorted(list_ids, np.arange(self.n_lists + 1))
+            for probe in np.flatnonzero(np.diff(bounds)):
+                members = query_ids[bounds[probe]:bounds[probe + 1]]
+                begin, end = self.list_offsets[probe], self.list_offsets[probe + 1]
+                block_sims = np.matmul(batch[members], self.vectors[begin:end].astype(queries.dtype, copy=False).T)
+                rows[members], row_dists[members] = _merge_closest(rows[members], row_dists[members], block_sims, begin, k)
+
+            ids[start:start + len(batch)], dists[start:start + len(batch)] = _sort_closest(self.ids[rows], row_dists)
+        return ids, dists
+
+    def _arrays(self):
+        return {"vectors": self.vectors, "centroids": self.centroids, "list_offsets": self.list_offsets, "ids": self.ids}
+
+    def _parameters(self):
+        return {"n_lists": self.n_lists, "n_probe": self.n_probe, "batch_size": self.batch_size, "dtype": self.dtype.name}
+
+
+INDEX_TYPES = {index_class.index_type: index_class for index_class in [ExactIndex, IVFIndex]}
+
+
+def load_index(path):
+    """
+    Load an index of any type saved with its save method.
+
+    Args:
+        path: Path prefix of the index files.
+
+    Returns:
+        The loaded index (ExactIndex or IVFIndex).
+    """
+    with open(path + ".json") as infile:
+        index_type = json.load(infile)["type"]
+    return INDEX_TYPES[index_type].load(path)
+
 
-def _compute_distances_raw(l1, l2, embedder, n_closest=-1, return_distances=False):
+def index_key(embedder, items):
+    """
+    Identify the embeddings of the items computed with the embedder, e.g. to check that a stored index was built
+    over the same items with the same embedder parameters.
+
+    Args:
+        embedder: A fitted SIFEmbedder object.
+        items: A list of the indexed keywords or categories (str), in the order they are indexed.
+
+    Returns:
+        String with a hash of the embedder parameters and the items.
+    """
+    key = hashlib.sha1(embedder.fingerprint().encode("utf8"))
+    for item in items:
+        key.update(item.encode("utf8"))
+        key.update(b"\n")
+    return key.hexdigest()
+
+
+def recall_at_k(exact_ids, approximate_ids):
+    """
+    Compute the average fraction of the exact k closest rows that were also found by an approximate search.
+
+    Args:
+        exact_ids: A numpy array of indices of the exact closest rows (A x k).
+        approximate_ids: A numpy array of indices of the approximate closest rows (A x k).
+
+    Returns:
+        Recall@k as a float.
+    """
+    if exact_ids.size == 0:
+        return 1.
+    found = sum(len(np.intersect1d(exact, approximate)) for exact, approximate in zip(exact_ids, approximate_ids))
+    return found / float(exact_ids.size)
+
+
+def _search_index(index, keywords, embedder, n_closest, batch_size=4000):
+    """
+    Find the ``n_closest`` indexed rows for each of the keywords, embedding the keywords in batches.
+
+    Returns:
+        Tuple of numpy arrays of indices and cosine distances, both of dimensions len(keywords) x ``n_closest``.
+    """
+    if n_closest < 0:
+        n_closest = len(index)
+    inds = np.zeros((len(keywords), n_closest), dtype=int)
+    dists = np.zeros((len(keywords), n_closest), dtype=embedder.dtype)
+    for start in tqdm(range(0, len(keywords), batch_size), desc='Searching index'):
+        queries = embedder.embed(keywords[start:start + batch_size], normalize=True)
+        with metrics.span("index_search"):
+            inds[start:start + batch_size], dists[start:start + batch_size] = index.search(queries, n_closest)
+    return inds, dists
+
+
+# default memory in bytes used by the blocks of embeddings and distances in _compute_distances_raw
+DISTANCE_MEMORY_BUDGET = 256 * 2 ** 20
+
+
+@lru_cache(maxsize=None)
+def _blas_threads():
+    """
+    Number of threads used by BLAS as reported by threadpoolctl, or the number of cores if it is not installed.
+    Determined once, as querying it takes milliseconds.
+    """
+    try:
+        from threadpoolctl import threadpool_info
+    except ImportError:
+        return os.cpu_count() or 1
+    threads = [pool["num_threads"] for pool in threadpool_info() if pool["user_api"] == "blas"]
+    return max(threads) if threads else os.cpu_count() or 1
+
+
+@lru_cache(maxsize=None)
+def _cache_size():
+    """
+    Size in bytes of the largest CPU cache (Linux only), or None if it is not known.
+    """
+    sizes = []
+    for path in glob.glob("/sys/devices/system/cpu/cpu0/cache/index*/size"):
+        with open(path) as infile:
+            size = infile.read().strip()
+        units = {"K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30}
+        sizes.append(int(size[:-1]) * units[size[-1]] if size[-1] in units else int(size))
+    return max(sizes) if sizes else None
+
+
+def _block_sizes(n_streamed, n_resident, dimension, itemsize, memory_budget):
+    """
+    Choose the block sizes of _compute_distances_raw for the given memory budget.
+
+    A distance between a streamed and a resident row takes ``itemsize`` bytes plus 8 bytes for the indices of the
+    partial sort, and a streamed row additionally needs its embedding and the intermediate arrays of embedding it.
+    The resident side is compared as a single block if that leaves enough streamed rows to keep all BLAS threads
+    busy, otherwise it is split into blocks. Blocks never get smaller than 256 rows, even if that exceeds the budget.
+    Without a given budget, the distances of a block are also kept within the largest CPU cache (but at least 32 MB,
+    below which the matrix products get inefficient), as they are read once more for every closest row.
+
+    Args:
+        n_streamed: Number of rows embedded block by block.
+        n_resident: Number of rows kept in memory.
+        dimension: Dimension of the embeddings.
+        itemsize: Size in bytes of a float of the computation.
+        memory_budget: Memory in bytes for a block of streamed rows and the distances to a block of resident rows.
+            If None, DISTANCE_MEMORY_BUDGET, kept within the largest CPU cache.
+
+    Returns:
+        Tuple of the number of streamed rows and the number of resident rows in a block.
+    """
+    distance_bytes = itemsize + 8
+    row_bytes = 4 * dimension * itemsize
+    min_streamed = min(n_streamed, 256 * _blas_threads())
+    if memory_budget is None:
+        memory_budget = DISTANCE_MEMORY_BUDGET
+        cache_size = _cache_size()
+        if cache_size is not None:
+            memory_budget = min(memory_budget, max(cache_size, 32 * 2 ** 20))
+
+    resident_size = max(1, n_resident)
+    streamed_size = memory_budget // (resident_size * distance_bytes + row_bytes)
+    if streamed_size < min_streamed:
+        streamed_size = min_streamed
+        resident_size = max(256, (memory_budget - streamed_size * row_bytes) // (streamed_size * distance_bytes))
+    return max(1, min(streamed_size, n_streamed)), max(1, min(resident_size, n_resident))
+
+
+def _compute_distances_raw(l1, l2, embedder, n_closest=-1, return_distances=False, memory_budget=None):
     """
     Compute cosine distances between rows from ``m1`` to those from ``m2`` while return only indices and distances of ``n_closest``
     rows from m2.
 
+    The smaller of the two sides is embedded once and kept in memory, the larger one is embedded a block at a time
+    and compared to it. The block sizes follow from ``memory_budget`` (see _block_sizes).
+    The distances are computed in the floating point type of the embedder (``embedder.dtype``), given
+    embeddings stored in another type (e.g. float16) are converted one block at a time.
+
     Args:
-        m1: A numpy array of dimensions A x d
-        m2: A numpy array of dimensions B x d
+        l1: A list of A keywords to embed, or a numpy array of their normalized embeddings (A x d)
+        l2: A list of B keywords to embed, or a numpy array of their normalized embeddings (B x d)
         n_closest: Number of closest rows of m2 to return (n_closest=-1 returns all rows)
+        memory_budget: Memory in bytes for the blocks of embeddings and distances, on top of the resident side
+            and the result. If None, DISTANCE_MEMORY_BUDGET is used, or less to keep the blocks within the largest
+            CPU cache. (default: None)
         
     Returns:
         A numpy array of distances of dimensions A x ``n_closest``.
     """
+    if n_closest < 0:
+        n_closest = len(l2)
     assert n_closest <= len(l2)
+    dtype = embedder.dtype
     inds = np.zeros((len(l1), n_closest), dtype=int)
     if return_distances:
-        dists = np.zeros((len(l1), n_closest))
-    
-    batch_size = 4000
-    # if one of the lists is short enough, precompute its embeddings
-    # and normalize them
-    m1_pre, m2_pre = None, None
-    if len(l1) < batch_size:
-        m1_pre = embedder.embed(l1)
-        m1_pre = m1_pre / np.linalg.norm(m1_pre, ord=2, axis=-1, keepdims=True)
-    if len(l2) < batch_size:
-        m2_pre = embedder.embed(l2)
-        m2_pre = m2_pre / np.linalg.norm(m2_pre, ord=2, axis=-1, keepdims=True)
-    
-    for m1_start in tqdm(range(0, len(l1), batch_size), desc='Calculating distances'):
-        # normalize a batch of rows from m1
-        if m1_pre is not None:
-            m1_norm = m1_pre
-        else:
-            m1_norm = embedder.embed(l1[m1_start:m1_start + batch_size])
-            m1_norm = m1_norm / np.linalg.norm(m1_norm, ord=2, axis=-1, keepdims=True)
-
-        m1_size = min(batch_size, len(l1) - m1_start)
-        curr = [[] for i in range(m1_size)] # set of closest rows
-        for m2_start in tqdm(range(0, len(l2), batch_size), leave=False):
-            # normalize a batch of rows from m2
-            if m2_pre is not None:
-                m2_norm = m2_pre            
-            else:
-                m2_norm = embedder.embed(l2[m2_start:m2_start + batch_size])
-                m2_norm = m2_norm / np.linalg.norm(m2_norm, ord=2, axis=-1, keepdims=True)
-            # calculate and sort distances
-            curr_dists =  1. - np.matmul(m1_norm, m2_norm.T)
-            s_ids = m2_start + np.argsort(curr_dists, axis=-1)[:, :n_closest]
-            s_dists = np.sort(curr_dists, axis=-1)[:, :n_closest]
-            # merge to keep 'n_closest' rows from m2
-            for i in range(0, m1_size):
-                curr[i] = sorted(curr[i] + list(zip(s_ids[i], s_dists[i])), key=lambda x: x[1])[:n_closest] 
-            
-        # store the indices of n closest targets
-        inds[m1_start:m1_start + batch_size] = np.array([[x[0] for x in row] for row in curr])
+        dists = np.zeros((len(l1), n_closest), dtype=dtype)
+
+    def embed(keywords):
+        # normalized embeddings in the type of the computation
+        if isinstance(keywords, np.ndarray):
+            return keywords.astype(dtype, copy=False)
+        return embedder.embed(keywords, normalize=True)
+
+    def store(m1_start, curr_ids, curr_dists):
+        # sort the n closest targets by distance and store them
+        with metrics.span("topk_merge"):
+            curr_ids, curr_dists = _sort_closest(curr_ids, curr_dists)
+        inds[m1_start:m1_start + len(curr_ids)] = curr_ids
         if return_distances:
-            dists[m1_start:m1_start + batch_size] = np.array([[x[1] for x in row] for row in curr])
+            dists[m1_start:m1_start + len(curr_ids)] = curr_dists
+
+    # embed the smaller side once, stream the larger one
+    stream_l1 = len(l1) >= len(l2)
+    streamed, resident = (l1, l2) if stream_l1 else (l2, l1)
+    resident_norm = embed(resident)
+    streamed_size, resident_size = _block_sizes(
+        len(streamed), len(resident), resident_norm.shape[-1], dtype.itemsize, memory_budget)
+
+    # indices and distances of the closest rows of m2 so far for each block of rows of m1
+    closest = {}
+    for streamed_start in tqdm(range(0, len(streamed), streamed_size), desc='Calculating distances'):
+        streamed_norm = embed(streamed[streamed_start:streamed_start + streamed_size])
+        for resident_start in range(0, len(resident), resident_size):
+            resident_block = resident_norm[resident_start:resident_start + resident_size]
+            if stream_l1:
+                m1_start, m1_norm, m2_start, m2_norm = streamed_start, streamed_norm, resident_start, resident_block
+            else:
+                m1_start, m1_norm, m2_start, m2_norm = resident_start, resident_block, streamed_start, streamed_norm
+            if m1_start not in closest:
+                closest[m1_start] = np.zeros((len(m1_norm), 0), dtype=int), np.zeros((len(m1_norm), 0), dtype=dtype)
+            # calculate similarities and merge to keep 'n_closest' rows from m2
+            with metrics.span("distances"):
+                block_sims = np.matmul(m1_norm, m2_norm.T)
+                # rows without an embedding (e.g. empty keywords) are never the closest
+                block_sims[:, np.isnan(m2_norm[:, 0])] = -np.inf
+            with metrics.span("topk_merge"):
+                closest[m1_start] = _merge_closest(*closest[m1_start], block_sims, m2_start, n_closest)
+        if stream_l1 and streamed_start in closest:
+            # the block of m1 has been compared to all of m2
+            store(streamed_start, *closest.pop(streamed_start))
+    for m1_start, (curr_ids, curr_dists) in closest.items():
+        store(m1_start, curr_ids, curr_dists)
+
     if return_distances:
         return inds, dists
     return inds
@@ -347,12 +1725,22 @@ def _compute_distances_raw(l1, l2, embedder, n_closest=-1, return_distances=Fals
 
 class Categorizer(object):
     """Categorize (classify) keywords based on distance in embedding space."""
-    def __init__(self, embedder):
+    def __init__(self, embedder, index=None, cache_dir=None, storage_dtype=None, memory_budget=None):
         """
         Initialize the categorizer.
 
         Args:
             embedder: The SIFEmbedder object
+            index: An index (e.g. IVFIndex) over category embeddings used by categorize. If not yet fitted,
+                it is built in fit. A fitted index must have been built over the same categories with the same
+                embedder parameters. If None, exact search is used. (default: None)
+            cache_dir: Directory where category embeddings are cached between runs, keyed by the categories,
+                the embedder parameters and the word vectors. If None, they are not cached. (default: None)
+            storage_dtype: Type in which the category embeddings are kept in memory and cached, e.g. np.float16
+                to halve their size. Distances are still computed in the type of the embedder. If None, the type
+                of the embedder is used. (default: None)
+            memory_budget: Memory in bytes for the blocks of the exact distance computation. If None,
+                DISTANCE_MEMORY_BUDGET is used, or less to fit the largest CPU cache. (default: None)
         """
         if not embedder.fitted:
             raise ValueError('Embedder need to be fitted before initializing categorizer.')
@@ -362,9 +1750,13 @@ class Categorizer(object):
         self.fitted = False                 # Has the categorizer been fitted to categories?
         self.category_names = None          # A list of names (str) of categories
         self.category_ids = None            # A mapping of category ids (dict: str -> str)
-        self.category_embeddings = None     # A numpy array of category embeddings - i-th row corresponds
-                                            # to the i-th category name
+        self.category_embeddings = None     # A numpy array of normalized category embeddings - i-th row
+                                            # corresponds to the i-th category name
         self.clean_categories = None
+        self.index = index
+        self.cache_dir = cache_dir
+        self.storage_dtype = np.dtype(embedder.dtype if storage_dtype is None else storage_dtype)
+        self.memory_budget = memory_budget
 
     def fit(self, categories, category_ids=None):
         """
@@ -379,15 +1771,57 @@ class Categorizer(object):
             self.category_ids = dict(zip(categories, category_ids))
         # compute embeddings
         # first clean categories
-        clean_categories = [category_name.replace("/", " ").replace("&", " ") for category_name in self.category_names]
-        clean_categories = [re.sub(" +", " ", category_name.strip().lower()) for category_name in clean_categories]
-        clean_categories = [cat.lower() for cat in clean_categories]
+        clean_categories = [clean_category(category_name) for category_name in self.category_names]
 
         self.clean_categories = clean_categories
-        self.category_embeddings = self.embedder.embed(clean_categories)
+        self.category_embeddings = self._embed_categories(clean_categories)
+        if self.index is not None:
+            key = index_key(self.embedder, categories)
+            if not self.index.fitted:
+                self.index.fit(self.category_embeddings)
+                self.index.key = key
+            elif self.index.key != key:
+                raise ValueError('Index does not match the categories or the embedder parameters.')
         self.fitted = True
 
 
+    def fingerprint(self):
+        """
+        Identify the categories and embedder parameters, e.g. to invalidate cached results when they change.
+
+        Returns:
+            String with a hash of the categorizer parameters.
+        """
+        if not self.fitted:
+            raise RuntimeError("Categorizer not fitted. Nothing to identify")
+        parameters = hashlib.sha1(self.embedder.fingerprint().encode("utf8"))
+        parameters.update(json.dumps([self.category_names, self.category_ids]).encode("utf8"))
+        return parameters.hexdigest()
+
+    def _embed_categories(self, clean_categories):
+        """
+        Compute the normalized category embeddings (in the storage type), or load them from the cache directory.
+        """
+        cache_path = None
+        if self.cache_dir is not None:
+            key = hashlib.sha1(self.embedder.fingerprint().encode("utf8"))
+            key.update(model_fingerprint(self.embedder.model).encode("utf8"))
+            key.update("\n".join(clean_categories).encode("utf8"))
+            cache_path = os.path.join(self.cache_dir, f"categories-{key.hexdigest()}-{self.storage_dtype.name}.npy")
+            if os.path.isfile(cache_path):
+                return np.load(cache_path)
+
+        category_embeddings = self.embedder.embed(clean_categories, normalize=True).astype(self.storage_dtype)
+
+        if cache_path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # other processes sharing the cache directory only ever see complete files
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as outfile:
+                np.save(outfile, category_embeddings)
+            os.replace(tmp_path, cache_path)
+        return category_embeddings
+
     def categorize(self, keywords, n_categories = 3, lowercase=True):
         """
         Return the closest categories. The number of how many categories to return is a parameter.
@@ -399,17 +1833,24 @@ class Categorizer(object):
         Returns:
             A list of lists of category/distance pairs.
         """
-        if lowercase:
-            # transform the keywords to lower case
-            keywords = [kw.lower() for kw in keywords]
+        # categorize each distinct (lowercased) keyword once
+        metrics.increment("keywords_categorized", len(keywords))
+        keywords, inverse = deduplicate_keywords(keywords, lowercase=lowercase)
+        metrics.increment("unique_keywords", len(keywords))
+        # tokenize once for all the batches embedded below
+        keywords = TokenizedKeywords(keywords)
         
         # calculate raw
-        inds, dists = _compute_distances_raw(keywords, self.clean_categories, embedder=self.embedder, n_closest=n_categories, return_distances=True)
+        if self.index is not None:
+            inds, dists = _search_index(self.index, keywords, embedder=self.embedder, n_closest=n_categories)
+        else:
+            inds, dists = _compute_distances_raw(keywords, self.category_embeddings, embedder=self.embedder, n_closest=n_categories,
+                return_distances=True, memory_budget=self.memory_budget)
 
-        # collect top closest keywords
+        # collect top closest keywords (as python floats, whatever the type of the computation)
         results = []
-        for i in range(0, dists.shape[0]):
-            results.append([(self.category_names[ind], dist) for ind, dist in zip(inds[i], dists[i])])
+        for row_inds, row_dists in zip(inds.tolist(), dists.tolist()):
+            results.append([(self.category_names[ind], dist) for ind, dist in zip(row_inds, row_dists)])
         
         # if ids are available, add them to the output
         if self.category_ids is not None:
@@ -419,9 +1860,10 @@ class Categorizer(object):
                     for category_name, distance in row
                 ]
 
-        return results
+        # scatter the results back to the given keywords
+        return [results[key_i] for key_i in inverse.tolist()]
 
-    def closest_keywords(self, keywords, n_keywords, lowercase=True):
+    def closest_keywords(self, keywords, n_keywords, lowercase=True, keyword_index=None):
         """
         For each keyword k return the list of all categories where k is
         among 'n_keywords' closest keywords.
@@ -429,6 +1871,9 @@ class Categorizer(object):
         Args:
             keywords: A list of keywords (str).
             n_keywords: The number of closest keywords per category. (default: 1000)
+            keyword_index: An index (e.g. IVFIndex) over the embeddings of the keywords. If not yet fitted,
+                it is built here. A fitted index must have been built over the same (lowercased) keywords with
+                the same embedder parameters. If None, exact search is used. (default: None)
 
         Returns:
             A list of lists of category/distance pairs.
@@ -437,16 +1882,29 @@ class Categorizer(object):
             # transform the keywords to lower case
             keywords = [kw.lower() for kw in keywords]
         
+        if keyword_index is not None:
+            key = index_key(self.embedder, keywords)
+        # tokenize once for all the batches embedded below
+        keywords = TokenizedKeywords(keywords)
         # 'n_keywords' cannot be more then the actual number of keywords
         n_keywords = min(len(keywords), n_keywords)
         # calculate raw
-        inds, dists = _compute_distances_raw(self.clean_categories, keywords, embedder=self.embedder, n_closest=n_keywords, return_distances=True)
+        if keyword_index is not None:
+            if not keyword_index.fitted:
+                keyword_index.fit(self.embedder.embed(keywords))
+                keyword_index.key = key
+            elif keyword_index.key != key:
+                raise ValueError('Index does not match the keywords or the embedder parameters.')
+            inds, dists = keyword_index.search(self.category_embeddings.astype(self.embedder.dtype, copy=False), n_keywords)
+        else:
+            inds, dists = _compute_distances_raw(self.category_embeddings, keywords, embedder=self.embedder, n_closest=n_keywords,
+                return_distances=True, memory_budget=self.memory_budget)
 
         # collect top n closest keywords for each category
         results = [[] for i in range(len(keywords))]
-        for j in range(0, dists.shape[0]):
+        for j, (row_inds, row_dists) in enumerate(zip(inds.tolist(), dists.tolist())):
             # top n keywords closest to category
-            for i, dist in zip(inds[j], dists[j]):
+            for i, dist in zip(row_inds, row_dists):
                 results[i].append((self.category_names[j], dist))
                 
         # if ids are available, add them to the output
@@ -458,3 +1916,567 @@ class Categorizer(object):
                 ]
         
         return results
+
+
+# categorizer used by the worker processes of categorize_parallel - set before the workers are forked,
+# so they share the loaded model, word vectors and category embeddings with the parent process
+_shared_categorizer = None
+
+
+def _categorize_chunk(keywords, n_categories):
+    return _shared_categorizer.categorize(keywords, n_categories=n_categories)
+
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
+
+
+def _run_chunk(arguments):
+    function, chunk, function_arguments = arguments
+    # send the metrics of the chunk back to the parent process
+    metrics.reset()
+    results = function(chunk, *function_arguments)
+    return results, metrics.snapshot()
+
+
+def _map_chunks(function, chunks, function_arguments=(), n_workers=2):
+    """
+    Apply a module-level function to chunks in a pool of forked worker processes. At most two chunks per worker
+    are read ahead, so memory stays bounded for any number of chunks. The metrics of the workers are merged
+    into the metrics of this process. If the parallel kernel of weighted_average already ran in this process,
+    the chunks are processed here instead.
+
+    Returns:
+        A generator of (chunk, function(chunk, *function_arguments)) pairs, one per chunk, in input order.
+    """
+    if _parallel_kernel_started:
+        # forking a process with a running thread pool of numba can hang it at exit, so process the chunks here,
+        # where the parallel kernel uses all cores anyway
+        print("The parallel kernel of weighted_average already ran in this process, processing the chunks without worker processes.")
+        for chunk in chunks:
+            yield chunk, function(chunk, *function_arguments)
+        return
+
+    # fork the workers, so they do not need to load the model again
+    with multiprocessing.get_context("fork").Pool(n_workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.apply_async(_run_chunk, ((function, chunk, function_arguments),))))
+            if len(pending) >= 2 * n_workers:
+                chunk, results = pending.popleft()
+                results, chunk_metrics = results.get()
+                metrics.merge(chunk_metrics)
+                yield chunk, results
+        while len(pending) > 0:
+            chunk, results = pending.popleft()
+            results, chunk_metrics = results.get()
+            metrics.merge(chunk_metrics)
+            yield chunk, results
+
+
+def categorize_parallel(categorizer, keyword_chunks, n_categories=3, n_workers=2):
+    """
+    Categorize keywords with a pool of worker processes, each categorizing a chunk of keywords at a time.
+    At most two chunks per worker are read ahead, so memory stays bounded for any number of chunks.
+
+    Args:
+        categorizer: A fitted Categorizer object.
+        keyword_chunks: An iterable of lists of target keywords (str), e.g. from iter_chunks.
+        n_categories: The number of categories to return. (default: 3)
+        n_workers: Number of worker processes. (default: 2)
+
+    Returns:
+        A generator of (keywords, results of Categorizer.categorize) pairs, one per chunk, in input order.
+    """
+    global _shared_categorizer
+    _shared_categorizer = categorizer
+    return _map_chunks(_categorize_chunk, keyword_chunks, (n_categories,), n_workers=n_workers)
+
+
+class KeywordClusterer(object):
+    """
+    Discover groups of keywords without a list of categories by clustering their normalized embeddings with
+    mini-batch k-means. The keywords are streamed: the centroids are updated one mini-batch at a time, so
+    any number of keywords can be clustered in bounded memory, and the keywords can be embedded by several
+    worker processes. Keywords are assigned to the cluster with the closest centroid in cosine distance.
+
+    Optionally, the clusters are refined hierarchically: their centroids are merged bottom-up (agglomerative
+    clustering with average linkage on cosine distances) into ``n_groups`` coarser groups.
+    """
+    def __init__(self, embedder, n_clusters=100, n_groups=None, batch_size=10000, n_representatives=10,
+        random_state=0, memory_budget=None):
+        """
+        Initialize the clusterer.
+
+        Args:
+            embedder: The SIFEmbedder object
+            n_clusters: Number of clusters. (default: 100)
+            n_groups: Number of groups the clusters are merged into. If None, the clusters are not refined. (default: None)
+            batch_size: Number of keywords in a k-means mini-batch. (default: 10000)
+            n_representatives: Number of keywords closest to the centroid kept for each cluster. (default: 10)
+            random_state: Seed of the k-means initialization. (default: 0)
+            memory_budget: Memory in bytes for the blocks of the distance computation in assignment. If None,
+                DISTANCE_MEMORY_BUDGET is used, or less to fit the largest CPU cache. (default: None)
+        """
+        if not embedder.fitted:
+            raise ValueError('Embedder need to be fitted before initializing clusterer.')
+
+        self.embedder = embedder
+        self.n_clusters = n_clusters
+        self.n_groups = n_groups
+        self.batch_size = batch_size
+        self.n_representatives = n_representatives
+        self.random_state = random_state
+        self.memory_budget = memory_budget
+
+        self.fitted = False                 # Has the clusterer been fitted to keywords?
+        self.centroids = None               # A numpy array of normalized cluster centroids (n_clusters x d)
+        self.cluster_groups = None          # A numpy array of the group of each cluster (if refined)
+        self.cluster_sizes = None           # Number of keywords assigned to each cluster by assign
+        self.representatives = None         # A list of (keyword, distance) pairs closest to each centroid
+        self._kmeans = None
+        self._buffer = []                   # embeddings waiting for the first (initialization) mini-batch
+
+    def _embed(self, keywords, lowercase=True):
+        """
+        Compute the normalized embeddings of the keywords.
+        """
+        if lowercase:
+            keywords = [kw.lower() for kw in keywords]
+        return self.embedder.embed(keywords, normalize=True)
+
+    def _update(self, embeddings):
+        """
+        Update the centroids with the given normalized embeddings, a mini-batch at a time.
+        """
+        # rows without an embedding (e.g. empty keywords) are skipped
+        embeddings = embeddings[~np.isnan(embeddings[:, 0])]
+        with metrics.span("kmeans"):
+            if self._kmeans is None:
+                # k-means++ initialization needs more keywords than clusters, so buffer the first ones
+                self._buffer.append(embeddings)
+                if sum(len(buffered) for buffered in self._buffer) < max(3 * self.n_clusters, self.batch_size):
+                    return
+                embeddings = np.concatenate(self._buffer)
+                self._buffer = []
+                self._kmeans = MiniBatchKMeans(
+                    n_clusters=self.n_clusters, batch_size=self.batch_size, random_state=self.random_state)
+                self._kmeans.partial_fit(embeddings)
+                return
+            for start in range(0, len(embeddings), self.batch_size):
+                self._kmeans.partial_fit(embeddings[start:start + self.batch_size])
+
+    def _finish(self):
+        """
+        Normalize the centroids of the k-means model and refine them into groups.
+        """
+        if self._kmeans is None:
+            # fewer keywords than needed to fill the first mini-batch
+            embeddings = np.concatenate(self._buffer) if len(self._buffer) > 0 else np.zeros((0, 0))
+            self._buffer = []
+            if len(embeddings) < self.n_clusters:
+                raise ValueError(f'Cannot make {self.n_clusters} clusters of {len(embeddings)} keywords.')
+            self._kmeans = MiniBatchKMeans(
+                n_clusters=self.n_clusters, batch_size=self.batch_size, random_state=self.random_state)
+            self._kmeans.partial_fit(embeddings)
+
+        self.centroids = _normalize(self._kmeans.cluster_centers_).astype(self.embedder.dtype)
+        self.cluster_groups = None
+        if self.n_groups is not None:
+            self.cluster_groups = self.refine(self.n_groups)
+        self.fitted = True
+
+    def refine(self, n_groups):
+        """
+        Merge the clusters bottom-up into groups with agglomerative clustering of their centroids.
+
+        Args:
+            n_groups: Number of groups.
+
+        Returns:
+            A numpy array of the group (0 to n_groups - 1) of each cluster.
+        """
+        if n_groups >= len(self.centroids):
+            return np.arange(len(self.centroids))
+        with metrics.span("refinement"):
+            tree = linkage(self.centroids.astype(np.float64), method="average", metric="cosine")
+            return fcluster(tree, n_groups, criterion="maxclust") - 1
+
+    def partial_fit(self, keywords, lowercase=True):
+        """
+        Update the clusters with a chunk of keywords. The clusters can be used after the first chunks
+        have filled the initial mini-batch (of at least 3 * n_clusters keywords).
+
+        Args:
+            keywords: A list of keywords (str).
+        """
+        self._update(self._embed(keywords, lowercase=lowercase))
+        if self._kmeans is not None:
+            self._finish()
+
+    def fit(self, keyword_chunks, n_workers=1):
+        """
+        Cluster the keywords in one streaming pass.
+
+        Args:
+            keyword_chunks: An iterable of lists of keywords (str), e.g. from iter_chunks.
+            n_workers: Number of worker processes embedding the chunks. The centroids are updated in this
+                process. (default: 1)
+        """
+        self._kmeans = None
+        self._buffer = []
+        if n_workers > 1:
+            global _shared_clusterer
+            _shared_clusterer = self
+            chunk_embeddings = (embeddings for _, embeddings in _map_chunks(_embed_chunk, keyword_chunks, n_workers=n_workers))
+        else:
+            chunk_embeddings = (self._embed(keywords) for keywords in keyword_chunks)
+        for embeddings in tqdm(chunk_embeddings, desc='Clustering chunks'):
+            self._update(embeddings)
+        self._finish()
+
+    def predict(self, keywords, lowercase=True):
+        """
+        Assign keywords to the closest clusters.
+
+        Args:
+            keywords: A list of keywords (str).
+
+        Returns:
+            Tuple of numpy arrays of the cluster of each keyword (-1 for keywords without an embedding) and
+            the cosine distance to its centroid.
+        """
+        if not self.fitted:
+            raise RuntimeError("Clusterer not fitted. Nothing to assign to")
+        # assign each distinct (lowercased) keyword once
+        metrics.increment("keywords_clustered", len(keywords))
+        keywords, inverse = deduplicate_keywords(keywords, lowercase=lowercase)
+        metrics.increment("unique_keywords", len(keywords))
+        keywords = TokenizedKeywords(keywords)
+
+        inds, dists = _compute_distances_raw(keywords, self.centroids, embedder=self.embedder, n_closest=1,
+            return_distances=True, memory_budget=self.memory_budget)
+        inds, dists = inds[:, 0], dists[:, 0]
+        inds[np.isnan(dists)] = -1
+        return inds[inverse], dists[inverse]
+
+    def assign(self, keyword_chunks, n_workers=1):
+        """
+        Assign streamed keywords to the closest clusters, collecting the sizes of the clusters and the keywords
+        closest to each centroid (``cluster_sizes`` and ``representatives``) along the way.
+
+        Args:
+            keyword_chunks: An iterable of lists of keywords (str), e.g. from iter_chunks.
+            n_workers: Number of worker processes. (default: 1)
+
+        Returns:
+            A generator of (keywords, clusters, distances) triples, one per chunk, in input order
+            (see predict).
+        """
+        self.cluster_sizes = np.zeros(self.n_clusters, dtype=np.int64)
+        self.representatives = [[] for _ in range(self.n_clusters)]
+        if n_workers > 1:
+            global _shared_clusterer
+            _shared_clusterer = self
+            chunk_results = _map_chunks(_assign_chunk, keyword_chunks, n_workers=n_workers)
+        else:
+            chunk_results = ((keywords, self.predict(keywords)) for keywords in keyword_chunks)
+        for keywords, (inds, dists) in chunk_results:
+            self._update_representatives(keywords, inds, dists)
+            yield keywords, inds, dists
+
+    def _update_representatives(self, keywords, inds, dists):
+        """
+        Count the keywords assigned to each cluster and keep the ``n_representatives`` closest to each centroid.
+        """
+        assigned = np.flatnonzero(inds >= 0)
+        self.cluster_sizes += np.bincount(inds[assigned], minlength=self.n_clusters)
+
+        # candidates are the closest keywords of each cluster in this chunk
+        assigned = assigned[np.lexsort((dists[assigned], inds[assigned]))]
+        clusters = inds[assigned]
+        ranks = np.arange(len(assigned)) - np.searchsorted(clusters, clusters)
+        updated = set()
+        for i in assigned[ranks < self.n_representatives].tolist():
+            self.representatives[inds[i]].append((keywords[i], float(dists[i])))
+            updated.add(inds[i])
+        for cluster in updated:
+            # repeated keywords are only listed once
+            representatives = OrderedDict()
+            for keyword, distance in sorted(self.representatives[cluster], key=lambda representative: representative[1]):
+                representatives.setdefault(keyword, distance)
+            self.representatives[cluster] = list(representatives.items())[:self.n_representatives]
+
+    def save(self, path):
+        """
+        Store the normalized centroids, the groups and the sizes of the clusters to a .npz file.
+
+        Args:
+            path: Path to the .npz file.
+        """
+        if not self.fitted:
+            raise RuntimeError("Clusterer not fitted. Nothing to save")
+        arrays = {"centroids": self.centroids}
+        if self.cluster_groups is not None:
+            arrays["groups"] = self.cluster_groups
+        if self.cluster_sizes is not None:
+            arrays["sizes"] = self.cluster_sizes
+        with metrics.span("parameter_serialization"):
+            np.savez(path, **arrays)
+
+    def load(self, path):
+        """
+        Load the centroids (and the groups and sizes of the clusters) stored by save.
+
+        Args:
+            path: Path to the .npz file.
+        """
+        with np.load(path) as arrays:
+            self.centroids = arrays["centroids"].astype(self.embedder.dtype)
+            self.cluster_groups = arrays["groups"] if "groups" in arrays else None
+            self.cluster_sizes = arrays["sizes"] if "sizes" in arrays else None
+        self.n_clusters = len(self.centroids)
+        self.n_groups = None if self.cluster_groups is None else int(self.cluster_groups.max()) + 1
+        self.fitted = True
+
+
+# clusterer used by the worker processes of KeywordClusterer.fit and assign, shared as _shared_categorizer
+_shared_clusterer = None
+
+
+def _embed_chunk(keywords):
+    return _shared_clusterer._embed(keywords)
+
+
+def _assign_chunk(keywords):
+    return _shared_clusterer.predict(keywords)
+
+
+class BatchCategorizer(object):
+    """
+    Categorize keywords requested concurrently from many threads (e.g. by a web server) by coalescing
+    the requests arriving within a short time window into a single call of Categorizer.categorize.
+    The categorizer is only ever used from one background thread.
+    """
+    def __init__(self, categorizer, max_wait=0.005, max_batch_size=4000):
+        """
+        Initialize the batch categorizer and start its background thread.
+
+        Args:
+            categorizer: A fitted Categorizer object.
+            max_wait: Maximal time (in seconds) to wait for more requests after the first one of a batch. (default: 0.005)
+            max_batch_size: Number of keywords after which a batch is processed without waiting. (default: 4000)
+        """
+        self.categorizer = categorizer
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+
+        self.requests = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @property
+    def category_names(self):
+        return self.categorizer.category_names
+
+    def categorize(self, keywords, n_categories=3):
+        """
+        Return the closest categories of the keywords. Blocks until the batch with the keywords is processed.
+        See Categorizer.categorize.
+        """
+        keywords = list(keywords)
+        result = Future()
+        with self.lock:
+            if self.closed:
+                # a request that picked this categorizer up before it was replaced
+                self._process([(keywords, n_categories, result)])
+            else:
+                self.requests.put((keywords, n_categories, result))
+        return result.result()
+
+    def close(self):
+        """
+        Process the requests already queued, then stop the background thread. Later requests are categorized
+        one at a time in the requesting thread.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.requests.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            # wait for the first request, then collect more until the batch is full or the time is up
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            n_keywords = len(request[0])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while n_keywords < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                n_keywords += len(request[0])
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch):
+        # fail only the requests with an invalid number of categories, not the whole batch
+        valid = []
+        for request in batch:
+            request_n_categories = request[1]
+            if isinstance(request_n_categories, (int, np.integer)) and not isinstance(request_n_categories, bool):
+                valid.append(request)
+            else:
+                request[2].set_exception(TypeError(f"n_categories must be an integer, not {request_n_categories!r}"))
+        batch = valid
+        if len(batch) == 0:
+            return
+
+        try:
+            keywords = [keyword for request_keywords, _, _ in batch for keyword in request_keywords]
+            # at most all the categories can be returned, -1 stands for all of them
+            n_all = len(self.category_names)
+            n_categories = [n_all if request_n_categories < 0 else min(request_n_categories, n_all)
+                for _, request_n_categories, _ in batch]
+            # the closest categories are sorted, so the results for fewer categories are a prefix
+            results = self.categorizer.categorize(keywords, n_categories=max(n_categories))
+
+            start = 0
+            for (request_keywords, _, result), request_n_categories in zip(batch, n_categories):
+                request_results = results[start:start + len(request_keywords)]
+                result.set_result([row[:request_n_categories] for row in request_results])
+                start += len(request_keywords)
+        except Exception as e:
+            # fail the requests of the batch, but keep serving the next ones
+            for _, _, result in batch:
+                if not result.done():
+                    result.set_exception(e)
+
+
+class CachedCategorizer(object):
+    """
+    A least recently used cache of categorization results in front of a Categorizer (or BatchCategorizer).
+    Repeated keywords are answered from the cache without embedding them again.
+    """
+    def __init__(self, categorizer, max_bytes=100 * 2 ** 20):
+        """
+        Initialize the cache.
+
+        Args:
+            categorizer: A fitted Categorizer or BatchCategorizer object.
+            max_bytes: Approximate maximal memory used by the cached results. (default: 100 MB)
+        """
+        self.categorizer = categorizer
+        self.max_bytes = max_bytes
+
+        self.cache = OrderedDict()          # (keyword, n_categories, version) -> (results, size), oldest first
+        self.n_bytes = 0                    # approximate size of the cached results
+        self.version = None                 # fingerprint of the categorizer the results were computed with
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def category_names(self):
+        return self.categorizer.category_names
+
+    def set_categorizer(self, categorizer, version):
+        """
+        Replace the categorizer. If the version changed, the cached results are dropped.
+
+        Args:
+            categorizer: A fitted Categorizer or BatchCategorizer object.
+            version: Version of the categorizer, e.g. Categorizer.fingerprint().
+        """
+        with self.lock:
+            self.categorizer = categorizer
+            if version != self.version:
+                self.cache.clear()
+                self.n_bytes = 0
+                self.version = version
+
+    @staticmethod
+    def _normalize(keyword):
+        # the categorizer categorizes normalized keywords
+        return normalize_keyword(keyword)
+
+    @staticmethod
+    def _size(keyword, results):
+        return sys.getsizeof(keyword) + sum(
+            sys.getsizeof(result) + sum(sys.getsizeof(field) for field in result) for result in results) + 200
+
+    def categorize(self, keywords, n_categories=3):
+        """
+        Return the closest categories, from the cache when possible. See Categorizer.categorize.
+        """
+        with self.lock:
+            categorizer = self.categorizer
+            version = self.version
+            keys = [(self._normalize(keyword), n_categories, version) for keyword in keywords]
+            results = [None] * len(keywords)
+            missing = {}
+            for keyword_i, key in enumerate(keys):
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    results[keyword_i] = self.cache[key][0]
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(keyword_i)
+                    self.misses += 1
+
+        if len(missing) == 0:
+            return results
+
+        # categorize each missing keyword once
+        missing_keys = list(missing)
+        missing_results = categorizer.categorize([key[0] for key in missing_keys], n_categories=n_categories)
+
+        with self.lock:
+            for key, key_results in zip(missing_keys, missing_results):
+                key_results = [tuple(result[:-1]) + (float(result[-1]),) for result in key_results]
+                for keyword_i in missing[key]:
+                    results[keyword_i] = key_results
+                if key[2] != self.version or key in self.cache:
+                    continue
+                size = self._size(key[0], key_results)
+                self.cache[key] = (key_results, size)
+                self.n_bytes += size
+            # evict the least recently used results
+            while self.n_bytes > self.max_bytes and len(self.cache) > 0:
+                _, (_, size) = self.cache.popitem(last=False)
+                self.n_bytes -= size
+                self.evictions += 1
+
+        return results
+
+    def stats(self):
+        """
+        Return the cache counters (hits, misses, evictions) and size as a dictionary.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.cache),
+                "bytes": self.n_bytes
+            }
@@ -0,0 +1,139 @@
+# Developed in Python 3.6.7
+
+# Code for running the clustering functionality in cluster_keywords.py from command line.
+
+import cluster_keywords as ck
+import csv
+import argparse
+import os
+
+
+def open_keyword_chunks(args):
+    """Stream the keywords from the input file in chunks, reading ahead in a background thread."""
+    return ck.prefetch(ck.iter_chunks(
+        ck.iter_csv_column(
+            args.path_keywords,
+            args.keywords_column,
+            delimiter = args.keywords_delimiter),
+        args.chunk_size))
+
+
+def main_cluster(args):
+    # load language model
+    ft_model_filename = args.path_model
+    if args.path_word_vectors is not None:
+        # the FastText model is loaded only when an unknown word is encountered
+        print(f"Loading word vectors from: {args.path_word_vectors}")
+        model = ck.WordVectors.load(args.path_word_vectors, path_model=ft_model_filename)
+    else:
+        print(f"Loading language model from: {ft_model_filename}")
+        model = ck.load_FT_model(ft_model_filename)
+    print("Loaded embeddings!")
+
+
+    # build embedder
+    embedder_parameters_filename = args.path_embedder_parameters
+    print(f"Loading embedder parameters from: {embedder_parameters_filename}")
+    de_embedder = ck.SIFEmbedder(model, dtype=args.dtype)
+    de_embedder.load_file(embedder_parameters_filename)
+    print("Built embedder!")
+
+
+    # cluster the keywords in one streaming pass
+    clusterer = ck.KeywordClusterer(
+        de_embedder,
+        n_clusters=args.n_clusters,
+        n_groups=args.n_groups,
+        batch_size=args.batch_size,
+        n_representatives=args.n_representatives,
+        random_state=args.seed,
+        memory_budget=None if args.memory_budget is None else args.memory_budget * 2 ** 20)
+    print(f"Clustering keywords from: {args.path_keywords}")
+    clusterer.fit(open_keyword_chunks(args), n_workers=args.workers)
+    print(f"Built {args.n_clusters} clusters!")
+
+
+    # assign the keywords to the clusters in a second pass
+    output_filename = args.path_output
+    print(f"Writing clusters of keywords to: {output_filename}")
+    n_keywords = 0
+    with open(output_filename, "w", encoding="utf8") as outfile:
+        outwriter = csv.writer(outfile, delimiter=",", quotechar='"')
+        # write header
+        out_header = ["keyword", "cluster"]
+        if args.n_groups is not None:
+            out_header.append("group")
+        out_header.append("distance")
+        outwriter.writerow(out_header)
+
+        # write results chunk by chunk, row by row
+        for keywords, clusters, distances in clusterer.assign(open_keyword_chunks(args), n_workers=args.workers):
+            with ck.metrics.span("output_serialization"):
+                for keyword, cluster, distance in zip(keywords, clusters.tolist(), distances.tolist()):
+                    row = [f"{keyword}", f"{cluster}"]
+                    if args.n_groups is not None:
+                        row.append(f"{clusterer.cluster_groups[cluster]}" if cluster >= 0 else "-1")
+                    row.append(f"{distance}")
+                    outwriter.writerow(row)
+            n_keywords += len(keywords)
+    print(f'Clustered {n_keywords} keywords.')
+
+
+    # describe the clusters by their sizes and representative keywords
+    clusters_filename = args.path_clusters
+    if clusters_filename is None:
+        clusters_filename = os.path.splitext(output_filename)[0] + "_clusters.csv"
+    print(f"Writing clusters to: {clusters_filename}")
+    with open(clusters_filename, "w", encoding="utf8") as outfile:
+        outwriter = csv.writer(outfile, delimiter=",", quotechar='"')
+        out_header = ["cluster"]
+        if args.n_groups is not None:
+            out_header.append("group")
+        out_header.extend(["size", "keywords"])
+        outwriter.writerow(out_header)
+        for cluster, (size, representatives) in enumerate(zip(clusterer.cluster_sizes, clusterer.representatives)):
+            row = [f"{cluster}"]
+            if args.n_groups is not None:
+                row.append(f"{clusterer.cluster_groups[cluster]}")
+            row.extend([f"{size}", ",".join([keyword for keyword, distance in representatives])])
+            outwriter.writerow(row)
+
+    centroids_filename = args.path_centroids
+    if centroids_filename is None:
+        centroids_filename = os.path.splitext(output_filename)[0] + "_centroids.npz"
+    print(f"Dumping centroids to: {centroids_filename}")
+    clusterer.save(centroids_filename)
+
+    if args.profile:
+        print("Profile:")
+        print(ck.metrics.report())
+    print("DONE!")
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description='Tool for clustering keywords without categories using FastText models.')
+
+    argparser.add_argument('path_model', type=str, help='Path to the FastText model binary file.')
+    argparser.add_argument('path_embedder_parameters', type=str, help='Path to the embedder parameters file (.json or binary .npz).')
+    argparser.add_argument('path_keywords', type=str, help='Path to the input keywords csv file.')
+    argparser.add_argument('path_output', type=str, help='Path to the output csv file with the cluster of each keyword.')
+    argparser.add_argument('--n_clusters', '-k', type=int, default=100, help='Number of clusters. (default: 100)')
+    argparser.add_argument('--n_groups', type=int, default=None, help='Number of groups the clusters are merged into by hierarchical clustering of their centroids. (default: None - no groups)')
+    argparser.add_argument('--n_representatives', type=int, default=10, help='Number of keywords closest to the centroid listed for each cluster. (default: 10)')
+    argparser.add_argument('--batch_size', type=int, default=10000, help='Number of keywords in a k-means mini-batch. (default: 10000)')
+    argparser.add_argument('--path_clusters', type=str, default=None, help='Path to the output csv file with the size and representative keywords of each cluster. (default: path_output with suffix _clusters.csv)')
+    argparser.add_argument('--path_centroids', type=str, default=None, help='Path to the output .npz file with the centroids, groups and sizes of the clusters. (default: path_output with suffix _centroids.npz)')
+    argparser.add_argument('--path_word_vectors', '-wv', type=str, default=None, help='Path prefix of the word vectors store built with `embedder.py vectors`. If set, the FastText model is only loaded for unknown words. (default: None)')
+    argparser.add_argument('--dtype', type=str, choices=['float32', 'float64'], default='float32', help='Floating point type in which keyword embeddings and distances are computed. (default: float32)')
+    argparser.add_argument('--memory_budget', type=int, default=None, help='Memory in MB for the blocks of embeddings and distances compared at once when assigning keywords. (default: 256, or less to fit the blocks in the CPU cache)')
+    argparser.add_argument('--profile', action='store_true', help='Print the time spent in each stage and the keyword and out-of-vocabulary word counts at the end.')
+    argparser.add_argument('--workers', '-w', type=int, default=1, help='Number of worker processes embedding and assigning the keywords. (default: 1)')
+    argparser.add_argument('--chunk_size', type=int, default=100000, help='Number of keywords read, embedded and assigned at once. (default: 100000)')
+    argparser.add_argument('--seed', type=int, default=0, help='Random seed of the k-means initialization. (default: 0)')
+    argparser.add_argument('--keywords_delimiter', '-kd', type=str, default=',', help='Delimiter used in the keywords csv file. (default: \',\')')
+    argparser.add_argument('--keywords_column', '-kc', type=str, default='Keyword', help='Name of column containing keywords in the keywords csv file. (default: \'Keyword\')')
+
+    args = argparser.parse_args()
+
+    main_cluster(args)
@@ -39,8 +39,7 @@ def main_build(args):
     # store parameters
     embedder_params_filename = args.path_embedder_parameters
     print(f"Dumping embedder parameters to: {embedder_params_filename}")
-    with open(embedder_params_filename, "w") as outfile:
-        outfile.write(es_embedder.serialize())
+    es_embedder.save_file(embedder_params_filename)
 
 
     # if specified, store embeddings
@@ -50,29 +49,150 @@ def main_build(args):
     #    np.save(open(embeddings_path, 'wb'), embeddings)
 
 
+def main_update(args):
+    # load language model
+    ft_model_filename = args.path_model
+    print(f"Loading language model from: {ft_model_filename}")
+    model = ck.load_FT_model(ft_model_filename)
+    print("Loaded embeddings!")
+
+
+    # load existing embedder
+    embedder_parameters_filename = args.path_embedder_parameters
+    print(f"Loading embedder parameters from: {embedder_parameters_filename}")
+    es_embedder = ck.SIFEmbedder(model)
+    es_embedder.load_file(embedder_parameters_filename)
+    print(f"Loaded embedder version {es_embedder.version}!")
+
+
+    # get new keywords
+    keyword_filename = args.path_keywords
+    print(f"Loading keywords from: {keyword_filename}")
+    keywords = ck.load_csv_column(
+        keyword_filename,
+        args.keywords_column,
+        delimiter = args.keywords_delimiter)
+    print(f'Loaded {len(keywords)} keywords.')
+
+
+    # update embedder
+    es_embedder.partial_fit(keywords)
+
+
+    # store parameters
+    embedder_params_filename = args.path_output if args.path_output is not None else embedder_parameters_filename
+    print(f"Dumping embedder parameters version {es_embedder.version} to: {embedder_params_filename}")
+    es_embedder.save_file(embedder_params_filename)
+
+
+def main_vectors(args):
+    # load language model
+    ft_model_filename = args.path_model
+    print(f"Loading language model from: {ft_model_filename}")
+    model = ck.load_FT_model(ft_model_filename)
+    print("Loaded embeddings!")
+
+
+    # get the vocabulary from the embedder parameters
+    embedder_parameters_filename = args.path_embedder_parameters
+    print(f"Loading embedder parameters from: {embedder_parameters_filename}")
+    embedder = ck.SIFEmbedder(model)
+    embedder.load_file(embedder_parameters_filename)
+    words = list(embedder.word_frequencies)
+    print(f'Loaded {len(words)} words.')
+
+    # add the words of the categories, which are embedded too
+    if args.path_categories is not None:
+        vocabulary = set(words)
+        for categories_filename in args.path_categories:
+            print(f"Loading categories from: {categories_filename}")
+            categories = ck.load_csv_column(categories_filename, args.categories_column, delimiter=args.categories_delimiter)
+            new_words = []
+            for category in categories:
+                for word in ck.tokenize(ck.clean_category(category)):
+                    if word not in vocabulary:
+                        vocabulary.add(word)
+                        new_words.append(word)
+            words.extend(new_words)
+            print(f'Added {len(new_words)} words of {len(categories)} categories.')
+
+
+    # build and store word vectors
+    word_vectors = ck.WordVectors.build(model, words, dtype=np.dtype(args.dtype))
+    word_vectors_path = args.path_word_vectors
+    print(f"Dumping word vectors to: {word_vectors_path}.npy, {word_vectors_path}.vocab")
+    word_vectors.save(word_vectors_path)
+
+
+def main_convert(args):
+    # the model is not needed to convert the parameters
+    embedder = ck.SIFEmbedder(None)
+    print(f"Loading embedder parameters from: {args.path_embedder_parameters}")
+    embedder.load_file(args.path_embedder_parameters)
+    print(f"Dumping embedder parameters to: {args.path_output}")
+    embedder.save_file(args.path_output)
+
+
 if __name__ == '__main__':
     # parse command line arguments
     argparser = argparse.ArgumentParser(description='Tool for embedding keywords using FastText models.')
+    argparser.add_argument('--profile', action='store_true', help='Print the time spent in each stage and the keyword and out-of-vocabulary word counts at the end.')
     subparsers = argparser.add_subparsers()
 
     argparser_build = subparsers.add_parser('build', help='Build the SIF embedding parameters using given keywords.')
     argparser_build.add_argument('path_model', type=str, help='Path to FastText model binary file.')
     argparser_build.add_argument('path_keywords', type=str, help='Path to keywords file.')
-    argparser_build.add_argument('path_embedder_parameters', type=str, help='Path where to store the embedder parameters into a json file.')
+    argparser_build.add_argument('path_embedder_parameters', type=str, help='Path where to store the embedder parameters into a json file (or binary file if it ends with .npz).')
     argparser_build.add_argument('--keywords_delimiter', '-kd', type=str, default=',', help='Delimiter used in the keywords csv file. (default: \',\')')
     argparser_build.add_argument('--keywords_column', '-kc', type=str, default='Keyword', help='Name of column containing keywords in the keywords csv file. (default: \'Keyword\')')
     argparser_build.add_argument('--sample', '-s', type=int, default=1000000, help='Size of random sample of keywords. (default: 1000000)')
     #argparser_build.add_argument('--path_embeddings', type=str, help='Path to embeddings output file. If not set, the embeddings are not stored to disk.')
     argparser_build.set_defaults(command='build')
 
+    argparser_update = subparsers.add_parser('update', help='Update the SIF embedding parameters with new keywords. Parameters built before the update command existed do not store the sample of keywords this needs and must be built again.')
+    argparser_update.add_argument('path_model', type=str, help='Path to FastText model binary file.')
+    argparser_update.add_argument('path_keywords', type=str, help='Path to new keywords file.')
+    argparser_update.add_argument('path_embedder_parameters', type=str, help='Path to the embedder parameters file (.json or .npz) to update.')
+    argparser_update.add_argument('--path_output', '-o', type=str, default=None, help='Path where to store the updated embedder parameters. (default: overwrite path_embedder_parameters)')
+    argparser_update.add_argument('--keywords_delimiter', '-kd', type=str, default=',', help='Delimiter used in the keywords csv file. (default: \',\')')
+    argparser_update.add_argument('--keywords_column', '-kc', type=str, default='Keyword', help='Name of column containing keywords in the keywords csv file. (default: \'Keyword\')')
+    argparser_update.set_defaults(command='update')
+
+    argparser_convert = subparsers.add_parser('convert', help='Convert the embedder parameters between the json and binary (.npz) format.')
+    argparser_convert.add_argument('path_embedder_parameters', type=str, help='Path to the embedder parameters file (.json or .npz).')
+    argparser_convert.add_argument('path_output', type=str, help='Path where to store the converted parameters (.npz for binary, json otherwise).')
+    argparser_convert.set_defaults(command='convert')
+
+    argparser_vectors = subparsers.add_parser('vectors', help='Build a memory-mapped word vectors store for the embedder vocabulary.')
+    argparser_vectors.add_argument('path_model', type=str, help='Path to FastText model binary file.')
+    argparser_vectors.add_argument('path_embedder_parameters', type=str, help='Path to the embedder parameters file (.json or .npz).')
+    argparser_vectors.add_argument('path_word_vectors', type=str, help='Path prefix where to store the word vectors (.npy and .vocab files).')
+    argparser_vectors.add_argument('--dtype', type=str, choices=['float32', 'float16'], default='float32', help='Storage type of the word vectors. (default: float32)')
+    argparser_vectors.add_argument('--path_categories', type=str, nargs='+', default=None, help='Paths to categories files whose words are added to the store, so the categories are embedded without the FastText model. (default: None)')
+    argparser_vectors.add_argument('--categories_delimiter', '-cd', type=str, default=',', help='Delimiter used in the categories csv files. (default: \',\')')
+    argparser_vectors.add_argument('--categories_column', '-cc', type=str, default='Category', help='Name of column containing categories in the categories csv files. (default: \'Category\')')
+    argparser_vectors.set_defaults(command='vectors')
+
     # parse the args and call whatever function was selected
     args = argparser.parse_args()
 
     if args.command == 'build':
         print("Building embedding parameters")
         main_build(args)
+    elif args.command == 'update':
+        print("Updating embedding parameters")
+        main_update(args)
+    elif args.command == 'convert':
+        print("Converting embedding parameters")
+        main_convert(args)
+    elif args.command == 'vectors':
+        print("Building word vectors")
+        main_vectors(args)
     else:
         print("Unknown command!")
 
+    if args.profile:
+        print("Profile:")
+        print(ck.metrics.report())
 
     print("Done!!!")
\ No newline at end of file
@@ -1,36 +1,149 @@
 import argparse
+import os
+import threading
 from flask import Flask, Response, json, request
 import cluster_keywords as ck
 
 app = Flask(__name__)
 
+# state of the embedder parameters and categories files the categorizer was built from
+loaded_files = None
+reload_lock = threading.Lock()
+
+
+def watched_files(args):
+    """Modification times and sizes of the files the categorizer is built from."""
+    return [(os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in [args.path_embedder_parameters, args.path_categories]]
+
+
+def build_categorizer(args, model):
+    """Load the embedder parameters and categories and build the categorizer."""
+    # build embedder
+    embedder_parameters_filename = args.path_embedder_parameters
+    print(f"Loading embedder parameters from: {embedder_parameters_filename}")
+    de_embedder = ck.SIFEmbedder(model, dtype=args.dtype)
+    de_embedder.load_file(embedder_parameters_filename)
+    print("Built embedder!")
+
+
+    # get categories
+    categories_filename = args.path_categories
+    print(f"Loading categories from: {categories_filename}")
+    categories = ck.load_csv_column(categories_filename, args.categories_column, delimiter=',')
+    category_ids = ck.load_csv_column(categories_filename, args.categories_id_column, delimiter=',')
+    print(f'Loaded {len(categories)} categories.')
+
+
+    # build categorizer, optionally with an index over the categories
+    index = None
+    loaded_key = None
+    if args.index == 'ivf':
+        # a stored index only matches the categories and embedder parameters it was built with
+        if args.path_index is not None and os.path.isfile(args.path_index + ".json"):
+            index = ck.load_index(args.path_index)
+            if index.key == ck.index_key(de_embedder, categories):
+                print(f"Loaded index from: {args.path_index}")
+                loaded_key = index.key
+            else:
+                print(f"Index in {args.path_index} was built over other categories or embedder parameters, building a new one")
+                index = None
+        if index is None:
+            index = ck.IVFIndex(n_lists=args.n_lists, dtype=args.storage_dtype)
+        if args.n_probe is not None:
+            index.n_probe = args.n_probe
+    categorizer = ck.Categorizer(de_embedder, index=index, cache_dir=args.cache_dir, storage_dtype=args.storage_dtype,
+        memory_budget=None if args.memory_budget is None else args.memory_budget * 2 ** 20)
+    categorizer.fit(categories, category_ids=category_ids)
+    if index is not None and args.path_index is not None and index.key != loaded_key:
+        print(f"Dumping index to: {args.path_index}")
+        index.save(args.path_index)
+    print("Categorizer built!")
+    return categorizer
+
+
+def reload_categorizer(args, model):
+    """(Re)build the categorizer if the files it is built from changed, dropping outdated cached results."""
+    global loaded_files
+    if watched_files(args) == loaded_files:
+        return
+    with reload_lock:
+        files = watched_files(args)
+        if files == loaded_files:
+            # already reloaded by another thread
+            return
+        new_categorizer = build_categorizer(args, model)
+        version = new_categorizer.fingerprint()
+        # coalesce concurrent requests into micro-batches
+        new_categorizer = ck.BatchCategorizer(new_categorizer, max_wait=args.batch_window / 1000., max_batch_size=args.max_batch_size)
+        old_categorizer = categorizer.categorizer
+        categorizer.set_categorizer(new_categorizer, version)
+        loaded_files = files
+        # stop the background thread of the replaced categorizer, so it can be freed
+        if old_categorizer is not None:
+            old_categorizer.close()
+
+
+def error_response(message):
+    resp = Response(json.dumps({'error': message}), status=400,
+                    mimetype='application/json')
+    resp.headers["Content-Type"] = "application/json; charset=utf-8"
+    return resp
+
+
 @app.route('/categorise_keywords', methods=['POST'])
 def categorize():
-    req = request.get_json()
-    
-    keywords = req['keywords']
-    n_categories = req['n_categories'] if 'n_categories' in req else 3
-
-    result = categorizer.categorize(keywords, n_categories=n_categories)
-
-    response = []
-    for i, categories in enumerate(result):
-        response.append({
-            'keyword': keywords[i],
-            'categories': [
-                {
-                    'category': c[0],
-                    'id': c[1],
-                    'distance': c[2]
-                } for c in sorted(categories, key=lambda x: x[2])
-            ] 
-        })
-       
-    resp = Response(json.dumps(response), status=200,
+    with ck.metrics.span("request"):
+        reload_categorizer(args, model)
+        req = request.get_json(silent=True)
+        if not isinstance(req, dict):
+            return error_response("The request body must be a json object.")
+
+        keywords = req.get('keywords')
+        n_categories = req['n_categories'] if 'n_categories' in req else 3
+        if not isinstance(keywords, list) or not all(isinstance(keyword, str) for keyword in keywords):
+            return error_response("'keywords' must be a list of strings.")
+        # -1 returns all the categories
+        n_all = len(categorizer.category_names)
+        if isinstance(n_categories, bool) or not isinstance(n_categories, int) or not (n_categories == -1 or 1 <= n_categories <= n_all):
+            return error_response(f"'n_categories' must be an integer between 1 and {n_all}, or -1 for all categories.")
+
+        result = categorizer.categorize(keywords, n_categories=n_categories)
+
+        with ck.metrics.span("response_serialization"):
+            response = []
+            for i, categories in enumerate(result):
+                response.append({
+                    'keyword': keywords[i],
+                    'categories': [
+                        {
+                            'category': c[0],
+                            'id': c[1],
+                            'distance': c[2]
+                        } for c in sorted(categories, key=lambda x: x[2])
+                    ]
+                })
+            response = json.dumps(response)
+
+    resp = Response(response, status=200,
                     mimetype='application/json')
     resp.headers["Content-Type"] = "application/json; charset=utf-8"
     return resp
 
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    resp = Response(json.dumps(categorizer.stats()), status=200,
+                    mimetype='application/json')
+    return resp
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # timing spans and counters of the hot paths, and the cache counters
+    cache = {f"cache_{name}": value for name, value in categorizer.stats().items()}
+    resp = Response(ck.metrics.prometheus(gauges=cache), status=200,
+                    mimetype='text/plain')
+    resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return resp
+
 # @app.route('/categorize', methods=['POST'])
 # def categorize():
 #     req = request.get_json()
@@ -63,43 +176,49 @@ if __name__ == "__main__":
     argparser = argparse.ArgumentParser(description='Server for categorising keywords using FastText models.')
     
     argparser.add_argument('path_model', type=str, help='Path to the FastText model binary file.')
-    argparser.add_argument('path_embedder_parameters', type=str, help='Path to the embedder parameters json file.')
+    argparser.add_argument('path_embedder_parameters', type=str, help='Path to the embedder parameters file (.json or binary .npz).')
     argparser.add_argument('path_categories', type=str, help='Path to the categories file.')
     argparser.add_argument('--categories_delimiter', '-cd', type=str, default=',', help='Delimiter used in the categories csv file. (default: \',\')')
     argparser.add_argument('--categories_column', '-cc', type=str, default='Category', help='Name of column containing categories in the categories csv file. (default: \'Category\')')
     argparser.add_argument('--categories_id_column', '-cic', type=str, default='CategoryID', help='Name of column containing category ids in the categories csv file. (default: \'CategoryID\')')
+    argparser.add_argument('--path_word_vectors', '-wv', type=str, default=None, help='Path prefix of the word vectors store built with `embedder.py vectors`. If set, the FastText model is only loaded for unknown words. (default: None)')
+    argparser.add_argument('--cache_dir', type=str, default=None, help='Directory where category embeddings are cached between runs. (default: None)')
+    argparser.add_argument('--dtype', type=str, choices=['float32', 'float64'], default='float32', help='Floating point type in which keyword embeddings and distances are computed. (default: float32)')
+    argparser.add_argument('--storage_dtype', type=str, choices=['float32', 'float16'], default='float32', help='Floating point type in which category embeddings are cached and indexed. (default: float32)')
+    argparser.add_argument('--memory_budget', type=int, default=None, help='Memory in MB for the blocks of embeddings and distances compared at once in exact search. (default: 256, or less to fit the blocks in the CPU cache)')
+    argparser.add_argument('--index', type=str, choices=['exact', 'ivf'], default='exact', help='Nearest neighbour search method: exact or approximate (inverted file index). (default: exact)')
+    argparser.add_argument('--path_index', type=str, default=None, help='Path prefix of the index files. Loaded if it exists and was built over the same categories with the same embedder parameters, otherwise the built index is stored there. (default: None)')
+    argparser.add_argument('--n_lists', type=int, default=None, help='Number of clusters of a new ivf index. (default: square root of the number of categories)')
+    argparser.add_argument('--n_probe', type=int, default=None, help='Number of clusters searched by the ivf index. Higher is more exact and slower. (default: 8)')
+    argparser.add_argument('--threads', type=int, default=16, help='Number of threads serving requests. (default: 16)')
+    argparser.add_argument('--batch_window', type=float, default=5., help='Time in milliseconds to wait for concurrent requests to categorise together. (default: 5)')
+    argparser.add_argument('--max_batch_size', type=int, default=4000, help='Number of keywords after which a batch is categorised without waiting. (default: 4000)')
+    argparser.add_argument('--cache_size', type=int, default=100, help='Memory in MB for caching results of repeated keywords. (default: 100)')
     argparser.add_argument("-p", "--port", type=int, default=5000)
     args = argparser.parse_args()
 
 
     # load language model
     ft_model_filename = args.path_model
-    print(f"Loading language model from: {ft_model_filename}")
-    model = ck.load_FT_model(ft_model_filename)
+    if args.path_word_vectors is not None:
+        # the FastText model is loaded only when an unknown word is encountered
+        print(f"Loading word vectors from: {args.path_word_vectors}")
+        model = ck.WordVectors.load(args.path_word_vectors, path_model=ft_model_filename)
+    else:
+        print(f"Loading language model from: {ft_model_filename}")
+        model = ck.load_FT_model(ft_model_filename)
     print("Loaded embeddings!")
 
 
-    # build embedder
-    embedder_parameters_filename = args.path_embedder_parameters
-    print(f"Loading embedder parameters from: {embedder_parameters_filename}")
-    de_embedder_parameters_json = open(embedder_parameters_filename).read()
-    de_embedder = ck.SIFEmbedder(model)
-    de_embedder.load(de_embedder_parameters_json)
-    print("Built embedder!")
-
-
-    # get categories
-    categories_filename = args.path_categories
-    print(f"Loading categories from: {categories_filename}")
-    categories = ck.load_csv_column(categories_filename, args.categories_column, delimiter=',')
-    category_ids = ck.load_csv_column(categories_filename, args.categories_id_column, delimiter=',')
-    print(f'Loaded {len(categories)} categories.')
-
-
-    # build categorizer
-    categorizer = ck.Categorizer(de_embedder)
-    categorizer.fit(categories, category_ids=category_ids)
-    print("Categorizer built!")
+    # build categorizer, cache its results and reload it whenever its files change
+    categorizer = ck.CachedCategorizer(None, max_bytes=args.cache_size * 2 ** 20)
+    reload_categorizer(args, model)
 
     # run server
-    app.run(host='127.0.0.1', port=args.port)
\ No newline at end of file
+    try:
+        from waitress import serve
+    except ImportError:
+        print("waitress not installed - running the Flask development server")
+        app.run(host='127.0.0.1', port=args.port, threaded=True)
+    else:
+        serve(app, host='127.0.0.1', port=args.port, threads=args.threads)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+import cluster_keywords as ck
+
+
+def make_embedder(dtype=np.float64, n_words=300, dimension=50, n_keywords=2000):
+    """Fit an embedder to random keywords over a store of random word vectors."""
+    r = np.random.RandomState(0)
+    words = [f"w{i}" for i in range(n_words)]
+    model = ck.WordVectors(words, r.randn(n_words, dimension).astype(np.float32))
+    keywords = [" ".join(r.choice(words, r.randint(1, 5))) for _ in range(n_keywords)]
+    embedder = ck.SIFEmbedder(model, dtype=dtype)
+    embedder.fit(keywords)
+    return embedder, words, keywords
+
+
+def test_ivf_index_skips_empty_rows():
+    r = np.random.RandomState(0)
+    embeddings = r.randn(500, 20)
+    embeddings[[3, 250]] = 0.
+    queries = ck._normalize(r.randn(50, 20))
+
+    index = ck.IVFIndex(n_lists=10)
+    index.fit(embeddings)
+    # the empty rows are not in any of the lists
+    assert set(index.ids[index.list_offsets[-1]:].tolist()) == {3, 250}
+    assert not np.isin([3, 250], index.search(queries, 5)[0]).any()
+
+    # probing all the lists is exact search
+    exact = ck.ExactIndex()
+    exact.fit(embeddings)
+    exact_ids, exact_dists = exact.search(queries, 5)
+    ids, dists = index.search(queries, 5, n_probe=10)
+    np.testing.assert_array_equal(ids, exact_ids)
+    np.testing.assert_allclose(dists, exact_dists, rtol=1e-5)
+
+
+def test_categorize_top_k_agrees_across_precisions():
+    embedder, words, keywords = make_embedder(dtype=np.float64)
+    r = np.random.RandomState(1)
+    categories = sorted(set("/" + " ".join(r.choice(words, r.randint(1, 4))) for _ in range(500)))
+    keywords = keywords[:1000]
+
+    def top_k(dtype, storage_dtype):
+        embedder.dtype = np.dtype(dtype)
+        categorizer = ck.Categorizer(embedder, storage_dtype=storage_dtype)
+        categorizer.fit(categories)
+        return [[category for category, _ in row] for row in categorizer.categorize(keywords, n_categories=5)]
+
+    expected = top_k(np.float64, np.float64)
+    for dtype, storage_dtype in [(np.float32, np.float32), (np.float32, np.float16)]:
+        found = top_k(dtype, storage_dtype)
+        # near ties may swap places at the edge of the top 5, anything more is a regression
+        agreement = np.mean([len(set(row) & set(expected_row)) / 5. for row, expected_row in zip(found, expected)])
+        assert agreement >= 0.99, (dtype, storage_dtype, agreement)
+        assert np.mean([row[0] == expected_row[0] for row, expected_row in zip(found, expected)]) >= 0.99
+
+
+def ragged_batch(n_keywords=200, n_words=100, dimension=30):
+    """Random token ids, offsets, word weights and word vectors of keywords, the first and fifth without tokens."""
+    r = np.random.RandomState(0)
+    lengths = r.randint(1, 6, n_keywords)
+    lengths[[0, 4]] = 0
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    token_ids = r.randint(n_words, size=offsets[-1])
+    return token_ids, offsets, r.rand(n_words), r.randn(n_words, dimension).astype(np.float32)
+
+
+@pytest.mark.skipif(ck.numba is None, reason="requires numba")
+def test_compiled_weighted_average_agrees_with_numpy():
+    token_ids, offsets, word_weights, word_vectors = ragged_batch()
+    principal_components = ck._normalize(np.random.RandomState(1).randn(2, word_vectors.shape[1]))
+    for dtype in [np.float32, np.float64]:
+        expected = ck.weighted_average(token_ids, offsets, word_weights, word_vectors, dtype=dtype,
+            principal_components=principal_components, compiled=False)
+        found = ck.weighted_average(token_ids, offsets, word_weights, word_vectors, dtype=dtype,
+            principal_components=principal_components, compiled=True)
+        assert found.dtype == expected.dtype
+        np.testing.assert_allclose(found, expected, rtol=1e-4, atol=1e-6)
+        assert not found[[0, 4]].any()
+
+
+KERNELS = [False, pytest.param(True, marks=pytest.mark.skipif(ck.numba is None, reason="requires numba"))]
+
+
+@pytest.mark.parametrize("compiled", KERNELS)
+def test_normalized_keywords_without_tokens_are_nan(compiled):
+    token_ids, offsets, word_weights, word_vectors = ragged_batch()
+    principal_components = ck._normalize(np.random.RandomState(1).randn(2, word_vectors.shape[1]))
+    embs = ck.weighted_average(token_ids, offsets, word_weights, word_vectors, dtype=np.float32,
+        principal_components=principal_components, normalize=True, compiled=compiled)
+    assert np.isnan(embs[[0, 4]]).all()
+    embedded = np.delete(embs, [0, 4], axis=0)
+    np.testing.assert_allclose(np.linalg.norm(embedded, axis=-1), 1., rtol=1e-5)
+
+
+@pytest.mark.parametrize("compiled", KERNELS)
+def test_empty_keywords_and_categories(monkeypatch, compiled):
+    if not compiled:
+        monkeypatch.setattr(ck, "numba", None)
+    embedder, words, keywords = make_embedder(dtype=np.float32)
+    embs = embedder.embed(["", keywords[0]], normalize=True)
+    assert np.isnan(embs[0]).all() and not np.isnan(embs[1]).any()
+
+    # an empty category is never among the closest, an empty keyword is categorized without an error
+    categories = ["/"] + sorted(set("/" + keyword for keyword in keywords[:50]))
+    for index in [None, ck.IVFIndex(n_lists=4)]:
+        categorizer = ck.Categorizer(embedder, index=index)
+        categorizer.fit(categories)
+        results = categorizer.categorize(["", keywords[0]], n_categories=3)
+        assert len(results[0]) == 3
+        assert "/" not in [category for category, _ in results[1]]
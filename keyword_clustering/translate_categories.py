@@ -5,15 +5,171 @@
 import json
 import csv
 import argparse
+import os
+import random
+import threading
+import time
 import pdb
 
+from multiprocessing.pool import ThreadPool
+
 from tqdm import tqdm
 
-# !pip install googletrans
-from googletrans import Translator
+
+class GoogleTranslateBackend(object):
+    """Translates texts with Google Translate through googletrans. Each thread uses its own Translator."""
+
+    def __init__(self):
+        # !pip install googletrans
+        from googletrans import Translator
+        self._translator_class = Translator
+        self._local = threading.local()
+
+    def translate(self, text, source_language, destination_language):
+        """
+        Translate a text.
+
+        Args:
+            text: Str with the text to translate.
+            source_language: Two letter (ISO 639-1) code of the language of the text.
+            destination_language: Two letter (ISO 639-1) code of the language to translate into.
+
+        Returns:
+            Str with the translated text.
+        """
+        if not hasattr(self._local, "translator"):
+            self._local.translator = self._translator_class()
+        return self._local.translator.translate(text, src=source_language, dest=destination_language).text
+
+
+class StubBackend(object):
+    """Offline stand-in for a translation service: prefixes every line with the destination language code."""
+
+    def __init__(self, latency=0.0):
+        """
+        Args:
+            latency: Seconds every call waits, to simulate the response time of a translation service.
+        """
+        self.latency = latency
+
+    def translate(self, text, source_language, destination_language):
+        time.sleep(self.latency)
+        return "\n".join(f"{destination_language}:{line}" for line in text.split("\n"))
 
 
-def translate_categories(categories, source_language, destination_language):
+BACKENDS = {
+    "google": GoogleTranslateBackend,
+    "stub": StubBackend,
+}
+
+
+class TranslationCache(object):
+    """
+    Translations of category segments stored in a json lines file, keyed by (source language, destination language,
+    segment). New translations are appended as they arrive, so an interrupted run keeps what it translated.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path: Path to the cache file. It is created if it does not exist. If None, the cache is kept in memory only.
+        """
+        self.path = path
+        self.translations = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if path is None:
+            return
+        if os.path.isfile(path):
+            with open(path, encoding="utf8") as infile:
+                for line in infile:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a partially written last line of an interrupted run
+                        continue
+                    self.translations[(entry["src"], entry["dest"], entry["text"])] = entry["translation"]
+        self._file = open(path, "a", encoding="utf8")
+
+    def get(self, source_language, destination_language, segment):
+        return self.translations.get((source_language, destination_language, segment))
+
+    def update(self, source_language, destination_language, segments, translations):
+        """Store the translations of segments and append them to the cache file."""
+        with self._lock:
+            for segment, translation in zip(segments, translations):
+                self.translations[(source_language, destination_language, segment)] = translation
+                if self._file is not None:
+                    self._file.write(json.dumps({
+                        "src": source_language,
+                        "dest": destination_language,
+                        "text": segment,
+                        "translation": translation}, ensure_ascii=False) + "\n")
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return len(self.translations)
+
+
+def make_batches(segments, max_characters=1000):
+    """Split segments into batches of newline separated segments of up to about max_characters characters."""
+    batches = []
+    batch = []
+    n_characters = 0
+    for segment in segments:
+        if batch and n_characters + len(segment) > max_characters:
+            batches.append(batch)
+            batch = []
+            n_characters = 0
+        batch.append(segment)
+        n_characters += len(segment) + 1
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def translate_batch(backend, batch, source_language, destination_language, max_retries=3):
+    """
+    Translate a batch of segments in one request, retrying failed requests with exponential backoff.
+
+    Args:
+        backend: Translation backend with a method translate(text, source_language, destination_language).
+        batch: A list of segments without newlines.
+        source_language: Two letter (ISO 639-1) code of the language of the segments.
+        destination_language: Two letter (ISO 639-1) code of the language to translate into.
+        max_retries: Number of times a failed request is repeated before the error is raised.
+
+    Returns:
+        A list of the translations of the segments.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            translations = backend.translate("\n".join(batch), source_language, destination_language).split("\n")
+            break
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            wait = 2 ** attempt * random.uniform(0.5, 1.5)
+            print(f"Translation request failed ({e}), retrying in {wait:.1f}s")
+            time.sleep(wait)
+    if len(translations) != len(batch):
+        # the service merged or split some lines, translate the segments one by one
+        if len(batch) == 1:
+            return ["\n".join(translations)]
+        return [translation
+            for segment in batch
+            for translation in translate_batch(backend, [segment], source_language, destination_language, max_retries)]
+    return [translation.strip() for translation in translations]
+
+
+def translate_categories(categories, source_language, destination_language, backend=None, cache=None, n_workers=4,
+        max_characters=1000, max_retries=3):
     """
     Translate Google adwords category names from one language into antoher using Google translate.
 
@@ -21,49 +177,46 @@ def translate_categories(categories, source_language, destination_language):
         categories: A list of category names.
         source_language: Source language of the categories. Str with the two letter (ISO 639-1) language code. (e.g. 'en')
         destination_language: Destination language of the categories. Str with the two letter (ISO 639-1) language code. (e.g. 'de')
+        backend: Translation backend with a method translate(text, source_language, destination_language). If None,
+            Google Translate is used.
+        cache: TranslationCache with the already translated segments. Only segments missing from it are translated
+            and they are added to it. If None, all segments are translated.
+        n_workers: Number of batches translated concurrently.
+        max_characters: Approximate number of characters in a batch of segments translated in one request.
+        max_retries: Number of times a failed request is repeated before the error is raised.
 
     Returns:
         A list of translated category names.
     """
-    t = Translator()
+    if backend is None:
+        backend = GoogleTranslateBackend()
+    if cache is None:
+        cache = TranslationCache()
 
-    # collect unique words
-    words = set([])
-    for category in categories:
-        for word in category.split('/'):
-            words.add(word)
-    words = list(words)
-    # remove blank word from start
-    words = words[1:]
-
-    word_map = {}
-    current_word = 0
-    # go over all words
-    with tqdm(total=len(words)) as pbar:
-        while current_word < len(words):
-            text = ""
-
-            # collect batches of up to 1000 words split by newlines
-            freeze_position = current_word
-            while current_word < len(words) and len(text) < 1000:
-                text += words[current_word] + "\n"
-                current_word += 1
-
-            # send batch to translate and split the result
-            translated_text = t.translate(
-                text,
-                src = source_language,
-                dest = destination_language
-            ).text.split('\n')
-            # map the word to its translation
-            for i in range(freeze_position, current_word):
-                word_map[words[i]] = translated_text[i - freeze_position]
-
-            pbar.update(current_word - freeze_position)
-    
-    # empty is empty
-    word_map[''] = ''
+    # collect unique segments of the category paths missing from the cache
+    segments = sorted(set(segment for category in categories for segment in category.split('/') if segment != ''))
+    missing = [segment for segment in segments if cache.get(source_language, destination_language, segment) is None]
+    print(f"Translating {len(missing)} of {len(segments)} segments, the rest are cached")
 
+    batches = make_batches(missing, max_characters)
+    def translate(batch):
+        translations = translate_batch(backend, batch, source_language, destination_language, max_retries)
+        cache.update(source_language, destination_language, batch, translations)
+        return len(batch)
+
+    with tqdm(total=len(missing)) as pbar:
+        if n_workers > 1 and len(batches) > 1:
+            with ThreadPool(n_workers) as pool:
+                for n_segments in pool.imap_unordered(translate, batches):
+                    pbar.update(n_segments)
+        else:
+            for batch in batches:
+                pbar.update(translate(batch))
+
+    # empty is empty
+    word_map = {'': ''}
+    for segment in segments:
+        word_map[segment] = cache.get(source_language, destination_language, segment)
 
     translated_categories = []
     for category in categories:
@@ -91,15 +244,30 @@ def main(args):
 
     category_names = [row[1] for row in rows]
 
-    print("Translating...")
-    translated_category_names = translate_categories(
-        category_names,
-        args.source_language,
-        args.destination_language)
+    backend = BACKENDS[args.backend]()
+    if args.path_cache is not None:
+        print(f"Using translation cache: {args.path_cache}")
+    cache = TranslationCache(args.path_cache)
+
+    extended_rows = [list(row) for row in rows]
+    source_header = header[1]
+    for destination_language in args.destination_language.split(','):
+        print(f"Translating into: {destination_language}")
+        translated_category_names = translate_categories(
+            category_names,
+            args.source_language,
+            destination_language,
+            backend=backend,
+            cache=cache,
+            n_workers=args.workers,
+            max_characters=args.batch_characters,
+            max_retries=args.max_retries)
 
-    # extend table with translations
-    header.append(header[1] + '_' + (args.destination_language).upper())
-    extended_rows = [row + [translated_category_names[row_i]] for row_i, row in enumerate(rows)]
+        # extend table with translations
+        header.append(source_header + '_' + destination_language.upper())
+        for row, translated_category_name in zip(extended_rows, translated_category_names):
+            row.append(translated_category_name)
+    cache.close()
 
     print(f"Writing translated categories to: {args.path_output}")
     with open(args.path_output, "w", encoding="utf8") as outfile:
@@ -118,9 +286,14 @@ if __name__ == '__main__':
 
     argparser.add_argument('path_categories', type=str, help='Path to input csv with categories. Assumed to contain two columns: \'category ID\' and \'category name\'.')
     argparser.add_argument('source_language', type=str, help='Source language of the categories. Str with the two letter (ISO 639-1) language code. (e.g. \'en\')')
-    argparser.add_argument('destination_language', type=str, help='Destination language of the categories. Str with the two letter (ISO 639-1) language code. (e.g. \'de\')')
+    argparser.add_argument('destination_language', type=str, help='Destination language of the categories. Str with the two letter (ISO 639-1) language code, or several comma separated codes, each added as a column. (e.g. \'de\' or \'de,es\')')
     argparser.add_argument('path_output', type=str, help='Path to the categories output file.')
     argparser.add_argument('--categories_delimiter', '-cd', type=str, default=',', help='Delimiter used in the categories csv file. (default: \',\')')
+    argparser.add_argument('--path_cache', type=str, default=None, help='Path to the json lines file where translated segments are cached between runs. Only segments missing from it are translated. (default: None)')
+    argparser.add_argument('--backend', type=str, choices=sorted(BACKENDS), default='google', help='Translation service. \'stub\' translates offline by prefixing the language code, for testing. (default: google)')
+    argparser.add_argument('--workers', '-w', type=int, default=4, help='Number of batches translated concurrently. (default: 4)')
+    argparser.add_argument('--batch_characters', type=int, default=1000, help='Approximate number of characters translated in one request. (default: 1000)')
+    argparser.add_argument('--max_retries', type=int, default=3, help='Number of times a failed translation request is repeated. (default: 3)')
 
     args = argparser.parse_args()
 